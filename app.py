@@ -4,14 +4,49 @@ from bs4 import BeautifulSoup
 import yt_dlp
 import os
 import re
-from urllib.parse import urljoin
+from urllib.parse import urljoin, urlparse
 import concurrent.futures # Para execução paralela de busca de títulos e infos
 import time # Para simular um atraso no download se necessário
+import atexit
+
+from ydl_pool import YdlPool
+from clips import clip_video_key, parse_clip
+from download_archive import DownloadArchive
+from download_catalog import DownloadCatalog
+from download_engine import DownloadEngine, DownloadJob, MultiRenditionJob
+from executors import ResizableExecutor, create_process_pool, create_thread_pool, worker_main_spec
+from janitor import sweep
+from preview_proxy import PreviewProxy, preview_source
+from job_journal import JobJournal
+from retention import RetentionManager, RetentionPolicy, load_policy, save_policy
+from bandwidth import BandwidthLimits, BandwidthShaper
+from batch_planner import (
+    InsufficientSpaceError, SpaceLedger, StorageLimits, plan_batch,
+    SCHEDULING_MODES, ScheduledJob, ThroughputMeter, schedule_batch, estimate_batch_eta,
+)
+from extraction import ExtractionError, archive_id_for_url, extract_video_info
+from integrity import INTEGRITY_WORKERS, CorruptDownloadError, IntegrityVerifier
+from format_policy import (
+    QualityPolicy, CODEC_PREFIXES, DEFAULT_PROFILES, build_format_matrix, apply_policy, summarize_selection,
+    load_profiles, save_profile, delete_profile,
+)
+
+# Os processos trabalhadores (extração, verificação) recriam o __main__: que carreguem executors, não este script
+__spec__ = worker_main_spec()
 
 # --- Configurações Iniciais ---
 DOWNLOAD_DIR = "downloads"
 if not os.path.exists(DOWNLOAD_DIR):
     os.makedirs(DOWNLOAD_DIR)
+QUALITY_PROFILES_FILE = "quality_profiles.json" # Perfis de qualidade salvos pelos usuários
+RETENTION_POLICY_FILE = "retention_policy.json" # Limites de retenção (valem para todas as sessões e sobrevivem a reinícios)
+CATALOG_DB = "downloads_catalog.sqlite3" # Catálogo persistente dos arquivos baixados (compartilhado entre sessões)
+ARCHIVE_DB = "downloads_archive.sqlite3"
+JOURNAL_DB = "downloads_journal.sqlite3"
+# Proxy de pré-visualização: o navegador de cada usuário acessa essa porta no mesmo host da página
+PREVIEW_PROXY_PORT = int(os.environ.get("PREVIEW_PROXY_PORT", "8502"))
+PREVIEW_PUBLIC_URL = os.environ.get("PREVIEW_PUBLIC_URL", "") # Endereço público do proxy, se diferente (ex.: atrás de um proxy reverso HTTPS)
+CATALOG_PAGE_SIZES = [25, 50, 100] # Opções de itens por página na listagem do catálogo
 
 st.set_page_config(layout="wide", page_title="Downloader de Vídeos Inteligente")
 
@@ -40,10 +75,166 @@ if 'download_statuses' not in st.session_state:
     st.session_state.download_statuses = {} # Armazena o status do download para cada URL (pending, downloading, completed, error)
 if 'downloaded_files' not in st.session_state:
     st.session_state.downloaded_files = {} # Armazena os caminhos dos arquivos baixados
+if 'downloaded_renditions' not in st.session_state:
+    st.session_state.downloaded_renditions = {} # Arquivos extras do modo "várias qualidades" (url -> lista de caminhos)
 if 'start_batch_download' not in st.session_state:
     st.session_state.start_batch_download = False
 if 'batch_download_in_progress' not in st.session_state:
     st.session_state.batch_download_in_progress = False
+if 'use_process_extraction' not in st.session_state:
+    st.session_state.use_process_extraction = False # Extrair informações num pool de processos (escapa do GIL)
+if 'probe_missing_sizes' not in st.session_state:
+    st.session_state.probe_missing_sizes = True # Consultar o servidor para estimar tamanhos ausentes
+if 'active_quality_profile' not in st.session_state:
+    st.session_state.active_quality_profile = next(iter(DEFAULT_PROFILES)) # Perfil aplicado automaticamente ao processar
+if 'scheduling_mode' not in st.session_state:
+    st.session_state.scheduling_mode = 'sjf' # Chave de SCHEDULING_MODES
+if 'batch_futures' not in st.session_state:
+    st.session_state.batch_futures = {} # url -> (Future, ScheduledJob, caminho) dos downloads do lote em andamento
+if 'batch_transfer_started' not in st.session_state:
+    st.session_state.batch_transfer_started = {} # url -> instante em que o download do lote ganhou uma vaga (base do ETA)
+if 'janitor_report' not in st.session_state:
+    st.session_state.janitor_report = None # Resultado da última limpeza de downloads incompletos
+if 'skip_archived' not in st.session_state:
+    st.session_state.skip_archived = True # Ignorar vídeos que já estão no arquivo de downloads
+if 'batch_clip_start' not in st.session_state:
+    st.session_state.batch_clip_start = '' # Trecho de todos os vídeos (vazio = vídeo inteiro), quando o card não define o seu
+if 'batch_clip_end' not in st.session_state:
+    st.session_state.batch_clip_end = ''
+if 'batch_clip_exact' not in st.session_state:
+    st.session_state.batch_clip_exact = False # Corte exato (recodifica as bordas) em vez de no keyframe
+if 'catalog_query' not in st.session_state:
+    st.session_state.catalog_query = '' # Busca nos títulos do catálogo de downloads
+if 'catalog_page' not in st.session_state:
+    st.session_state.catalog_page = 1
+
+# --- Recursos compartilhados entre re-execuções e sessões ---
+
+@st.cache_resource
+def get_ydl_pool():
+    """Pool de instâncias YoutubeDL reutilizadas pelas threads de extração e de download."""
+    pool = YdlPool()
+    atexit.register(pool.close_all)
+    return pool
+
+@st.cache_resource
+def get_info_executor():
+    """Executor persistente para extração de informações (mantém as instâncias YoutubeDL de cada worker)."""
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=5, thread_name_prefix="info")
+    atexit.register(executor.shutdown, wait=False)
+    return executor
+
+@st.cache_resource
+def get_extraction_process_pool():
+    """Pool de processos para a extração de informações, que é em boa parte Python limitado por CPU."""
+    executor = ResizableExecutor(create_process_pool, os.cpu_count() or 5)
+    atexit.register(executor.shutdown, wait=False, cancel_futures=True)
+    return executor
+
+@st.cache_resource
+def get_process_info_executor():
+    """Threads que aguardam o pool de processos de extração: uma por processo, redimensionadas junto com ele."""
+    executor = ResizableExecutor(create_thread_pool("info"), max(5, get_extraction_process_pool().max_workers))
+    atexit.register(executor.shutdown, wait=False)
+    return executor
+
+def resize_extraction_pool():
+    """Callback do número de processos de extração (o pool é compartilhado entre as sessões)."""
+    max_workers = st.session_state.extraction_workers_input
+    get_extraction_process_pool().resize(max_workers)
+    get_process_info_executor().resize(max(5, max_workers))
+
+def current_info_executor():
+    """Executor de informações para o modo de extração escolhido na barra lateral."""
+    if st.session_state.use_process_extraction:
+        return get_process_info_executor()
+    return get_info_executor()
+
+def current_process_pool():
+    """Pool de processos a repassar para get_video_info, ou None no modo de threads."""
+    if st.session_state.use_process_extraction:
+        return get_extraction_process_pool()
+    return None
+
+@st.cache_resource
+def get_integrity_process_pool():
+    """Pool de processos que verifica os arquivos concluídos, separado do pool de extração e das vagas de download."""
+    executor = create_process_pool(INTEGRITY_WORKERS)
+    atexit.register(executor.shutdown, wait=False, cancel_futures=True)
+    return executor
+
+@st.cache_resource
+def get_space_ledger():
+    """Reservas de espaço e limites de armazenamento, compartilhados por todas as sessões."""
+    return SpaceLedger(DOWNLOAD_DIR, StorageLimits(min_free_bytes=1024 ** 3)) # Até alguém mudar: 1 GB livre no disco, sem cota
+
+@st.cache_resource
+def get_throughput_meter():
+    """Vazão medida por host nos downloads concluídos, usada para ordenar o lote e estimar o ETA."""
+    return ThroughputMeter()
+
+@st.cache_resource
+def get_bandwidth_shaper():
+    """Controle de banda global, compartilhado por todos os downloads de todas as sessões."""
+    return BandwidthShaper()
+
+@st.cache_resource
+def get_download_catalog():
+    """Catálogo dos downloads concluídos, para reaproveitar arquivos já baixados em vez de baixar de novo."""
+    catalog = DownloadCatalog(CATALOG_DB)
+    atexit.register(catalog.close)
+    return catalog
+
+@st.cache_resource
+def get_retention_manager():
+    """Remoção em segundo plano dos downloads expirados ou excedentes (LRU pelo último acesso)."""
+    manager = RetentionManager(get_download_catalog(), load_policy(RETENTION_POLICY_FILE))
+    manager.start()
+    atexit.register(manager.stop)
+    return manager
+
+@st.cache_resource
+def get_job_journal():
+    """Diário das saídas de download (em andamento, falhas, concluídas), usado para limpar os restos."""
+    journal = JobJournal(JOURNAL_DB)
+    atexit.register(journal.close)
+    return journal
+
+@st.cache_resource
+def get_startup_janitor_report():
+    """Limpa uma vez, ao iniciar o servidor, os restos de downloads que falharam ou foram interrompidos."""
+    return sweep(DOWNLOAD_DIR, get_job_journal())
+
+@st.cache_resource
+def get_download_archive():
+    """Arquivo dos vídeos já baixados (extrator + id), consultado antes da extração e do download."""
+    archive = DownloadArchive(ARCHIVE_DB)
+    atexit.register(archive.close)
+    return archive
+
+@st.cache_resource
+def get_preview_proxy():
+    """Proxy que repassa ao player do navegador o vídeo da origem, para pré-visualizar sem baixar."""
+    proxy = PreviewProxy(port=PREVIEW_PROXY_PORT)
+    proxy.start()
+    atexit.register(proxy.stop)
+    return proxy
+
+@st.cache_resource
+def get_download_engine():
+    """Motor de downloads persistente, para que as threads e instâncias YoutubeDL sobrevivam às re-execuções."""
+    engine = DownloadEngine(
+        get_ydl_pool(), max_workers=2, space_ledger=get_space_ledger(), # Tamanhos iniciais; a barra lateral redimensiona
+        throughput_meter=get_throughput_meter(), bandwidth_shaper=get_bandwidth_shaper(),
+        catalog=get_download_catalog(), archive=get_download_archive(), journal=get_job_journal(),
+        verifier=IntegrityVerifier(get_integrity_process_pool()),
+    )
+    atexit.register(engine.shutdown)
+    return engine
+
+def resize_download_engine():
+    """Callback dos números de downloads e de mesclagens simultâneos (o motor é compartilhado entre as sessões)."""
+    get_download_engine().resize(st.session_state.parallel_downloads_input, st.session_state.postprocess_workers_input)
 
 # --- Funções Auxiliares ---
 
@@ -71,100 +262,219 @@ def clean_filename(title):
     return title.strip()
 
 @st.cache_data(ttl=3600) # Cachear informações de vídeo por 1 hora
-def get_video_info(url):
-    """Obtém informações sobre o vídeo (tamanhos, formatos) sem baixar."""
+def get_video_info(url, probe_sizes=True, _process_pool=None):
+    """
+    Obtém informações sobre o vídeo (tamanhos, formatos) sem baixar, como um VideoRecord compacto.
+    Tamanhos ausentes são estimados e ficam em cache junto com as informações.
+    Com `_process_pool`, a extração roda num processo separado.
+    """
     try:
-        ydl_opts = {
-            'quiet': True,
-            'skip_download': True,
-            'force_generic_extractor': True,
-            'noplaylist': True,
-            'default_search': 'ytsearch', # Ajuda a yt-dlp a inferir o tipo de link
-            'retries': 3,
-        }
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=False)
-            return info
-    except yt_dlp.utils.DownloadError as e:
+        if _process_pool is not None:
+            return _process_pool.submit(extract_video_info, url, None, probe_sizes).result()
+        return extract_video_info(url, get_ydl_pool(), probe_sizes)
+    except ExtractionError as e:
         st.error(f"Não foi possível extrair informações do vídeo em {url}: {e}")
         return None
     except Exception as e:
         st.error(f"Erro inesperado ao obter informações do vídeo em {url}: {e}")
         return None
 
-def parse_all_formats(info_dict):
+def build_output_filename(video_data, format_option, clip=None):
+    """Nome do arquivo de saída: nome base + número do vídeo + título limpo + parte da string de display (+ trecho)."""
+    final_filename_base = f"{st.session_state.base_name}{video_data['current_video_number']} {clean_filename(video_data['page_title_raw'])}"
+    clip_suffix = f"_{clip.label}" if clip else ""
+    return f"{final_filename_base}_{format_option.display.split(' - ')[0]}{clip_suffix}.mp4" # Pega "1080p@30fps" ou "720p"
+
+def expected_bytes(format_option, clip=None, duration=None):
+    """Tamanho esperado do download em bytes (None se desconhecido); de um trecho, proporcional à duração dele."""
+    if format_option.filesize_mb is None:
+        return None
+    size = format_option.filesize_mb * 1024 * 1024
+    if clip:
+        size *= clip.fraction(duration)
+    return int(size)
+
+def clip_for(video_url):
     """
-    Parses all available video formats from yt-dlp info_dict and returns a sorted list of options.
-    Each option is a tuple: (display_string, format_id, filesize_mb, resolution_height).
+    Trecho a baixar do vídeo: o definido no card ou, se vazio, o do lote; None = vídeo inteiro.
+    ValueError se os instantes digitados forem inválidos.
     """
-    formats = info_dict.get('formats', [])
-    parsed_options = []
-
-    for f in formats:
-        # Pular formatos sem vídeo ou apenas áudio (a menos que seja um formato específico com boa qualidade)
-        if f.get('vcodec') == 'none' and f.get('acodec') != 'none' and not f.get('is_hls', False):
-            continue # Pula áudio-only a menos que seja um formato que queremos explicitamente
-        if f.get('vcodec') == 'none' and f.get('acodec') == 'none': # Pula se não tem nem vídeo nem áudio
-            continue
-
-        height = f.get('height')
-        # Algumas vezes a altura não está presente para formatos combinados ou adaptativos, tentar inferir
-        if height is None:
-            format_note = f.get('format_note', '')
-            match = re.search(r'(\d{3,4})p', format_note)
-            if match:
-                height = int(match.group(1))
-
-        if not height: # Ainda sem altura, pode ser um formato estranho, pular
-            continue
-
-        filesize_bytes = f.get('filesize') or f.get('filesize_approx')
-        filesize_mb = filesize_bytes / (1024 * 1024) if filesize_bytes else None
-        
-        # Cria uma string de exibição clara
-        resolution_str = f"{height}p"
-        if f.get('fps'):
-            resolution_str += f"@{f['fps']}fps"
-
-        display_string = f"{resolution_str}"
-        if f.get('vcodec') and f['vcodec'] != 'none':
-            display_string += f" ({f['vcodec']}"
-            if f.get('acodec') and f['acodec'] != 'none':
-                display_string += f" + {f['acodec']})"
-            else:
-                display_string += " - apenas vídeo)"
-        elif f.get('acodec') and f['acodec'] != 'none':
-            display_string += f" (apenas áudio - {f['acodec']})"
-        
-        if filesize_mb is not None:
-            display_string += f" - {filesize_mb:.2f} MB"
-        else:
-            display_string += " - Tamanho N/D"
-
-        parsed_options.append({
-            "display": display_string,
-            "format_id": f['format_id'],
-            "height": height,
-            "filesize_mb": filesize_mb,
-            "is_combined": (f.get('vcodec') != 'none' and f.get('acodec') != 'none') # Indica se tem áudio e vídeo
-        })
-    
-    # Ordenar por altura descendente, e depois por tamanho/bitrate (implícito na ordem do yt-dlp)
-    # Preferir formatos combinados (áudio+vídeo) se houver opções separadas
-    parsed_options.sort(key=lambda x: (x['height'] if x['height'] else 0, x['is_combined'], x['filesize_mb'] if x['filesize_mb'] else 0), reverse=True)
-    
-    return parsed_options
+    video_data = st.session_state.processed_videos_data[video_url]
+    if video_data.get('clip_start') or video_data.get('clip_end'):
+        return parse_clip(video_data.get('clip_start'), video_data.get('clip_end'), video_data.get('clip_exact', False))
+    return parse_clip(st.session_state.batch_clip_start, st.session_state.batch_clip_end, st.session_state.batch_clip_exact)
+
+def format_eta(seconds):
+    """Formata segundos como "m:ss" ou "h:mm:ss"."""
+    minutes, secs = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{secs:02d}" if hours else f"{minutes}:{secs:02d}"
+
+def build_download_job(video_url, format_option, output_filepath, clip=None):
+    """
+    DownloadJob para o formato escolhido, com o áudio pareado, o tamanho esperado, o peso de banda e a chave do catálogo.
+    Com `clip`, só o trecho é baixado, e o trecho é um item à parte no catálogo.
+    """
+    video_data = st.session_state.processed_videos_data[video_url]
+    record = video_data['record']
+    duration = clip.length(record.duration) if clip else record.duration
+    return DownloadJob(
+        video_url, format_option.format_id, output_filepath,
+        audio_format_id=format_option.audio_format_id, expected_bytes=expected_bytes(format_option, clip, record.duration),
+        bandwidth_weight=bandwidth_weight(video_url),
+        catalog_key=(clip_video_key(record.canonical_id, clip), format_option.format_id, format_option.audio_format_id),
+        catalog_info={
+            'source_url': video_url, 'title': video_data['page_title_raw'] or record.title,
+            'format': format_option.display, 'duration': duration,
+        },
+        # Cortado no keyframe, o trecho começa um pouco antes do pedido: a duração não dá para conferir
+        expected_duration=duration if not clip or clip.exact else None,
+        expected_streams=expected_streams(format_option),
+        clip=clip,
+        # Mesma chave da filtragem das listagens; um trecho não conta como o vídeo baixado
+        archive_key=archive_id_for_url(video_url) if clip is None else None,
+    )
+
+def expected_streams(format_option):
+    """Streams que o arquivo final deve ter, pelos codecs conhecidos do formato (e do áudio pareado)."""
+    streams = []
+    if format_option.vcodec and format_option.vcodec != 'none':
+        streams.append('video')
+    if format_option.audio_format_id or (format_option.acodec and format_option.acodec != 'none'):
+        streams.append('audio')
+    return tuple(streams)
+
+@st.cache_data(ttl=600, show_spinner=False) # As URLs diretas costumam expirar: resolve de novo depois de 10 min
+def get_preview_source(video_url, format_id):
+    """URL direta e cabeçalhos do formato escolhido, para a pré-visualização (None se não for progressivo)."""
+    with get_ydl_pool().lease("stream", format=format_id) as ydl:
+        return preview_source(ydl, video_url)
+
+def preview_proxy_url(path):
+    """URL do proxy de pré-visualização que o navegador do usuário alcança: a configurada ou o host desta página."""
+    if PREVIEW_PUBLIC_URL:
+        return PREVIEW_PUBLIC_URL.rstrip('/') + path
+    host = urlparse(f"//{st.context.headers.get('Host') or 'localhost'}").hostname
+    if ':' in host:
+        host = f"[{host}]" # IPv6
+    return f"http://{host}:{get_preview_proxy().port}{path}"
+
+def mark_served(path):
+    """Registra o acesso (salvar ou reproduzir) ao arquivo, para a retenção por LRU."""
+    get_download_catalog().touch(path)
+
+def archived_urls(urls):
+    """URLs cujo vídeo já está no arquivo de downloads (vazio se a opção de pular estiver desligada)."""
+    if not st.session_state.skip_archived:
+        return set()
+    keys = {url: archive_id_for_url(url) for url in urls}
+    known = get_download_archive().known(keys.values())
+    return {url for url, key in keys.items() if key in known}
+
+def initial_status(video_url, video_record):
+    """Status de um vídeo recém-processado: já baixado antes (arquivo de downloads), pendente ou erro."""
+    if not video_record:
+        return 'error_info_fetch'
+    if video_url in archived_urls([video_url]):
+        return 'archived'
+    return 'pending'
+
+def bandwidth_weight(video_url):
+    """Peso na divisão da banda: no modo prioridade, cada 5 pontos de prioridade dobram (ou reduzem à metade) a fatia."""
+    if st.session_state.scheduling_mode != 'priority':
+        return 1.0
+    return 2 ** (st.session_state.get(f"priority_{video_url}", 0) / 5)
+
+def mbps_to_bytes(mbps):
+    """Converte MB/s da barra lateral em bytes/s (0 = sem limite -> None)."""
+    return int(mbps * 1024 * 1024) or None
+
+def apply_storage_limits():
+    """Callback dos campos de armazenamento: os limites do SpaceLedger valem para todas as sessões."""
+    get_space_ledger().configure(StorageLimits(
+        quota_bytes=int(st.session_state.download_quota_gb_input * 1024 ** 3) or None,
+        min_free_bytes=int(st.session_state.min_free_gb_input * 1024 ** 3),
+    ))
+
+def apply_retention_policy():
+    """Callback dos campos de retenção: a política apaga arquivos de todos, então é salva e só muda numa edição."""
+    policy = RetentionPolicy(
+        max_total_bytes=int(st.session_state.retention_max_gb_input * 1024 ** 3) or None,
+        max_age_seconds=st.session_state.retention_max_days_input * 86400 or None,
+    )
+    save_policy(RETENTION_POLICY_FILE, policy)
+    get_retention_manager().configure(policy)
+
+def bytes_to_mbps(rate):
+    """Inverso de mbps_to_bytes, para mostrar na barra lateral um limite em vigor (None -> 0)."""
+    return (rate or 0) / (1024 * 1024)
+
+def apply_bandwidth_limits():
+    """Callback dos campos de banda: o BandwidthShaper é compartilhado, então só uma edição muda os limites."""
+    get_bandwidth_shaper().configure(BandwidthLimits(
+        total=mbps_to_bytes(st.session_state.bandwidth_total_input),
+        per_job=mbps_to_bytes(st.session_state.bandwidth_per_job_input),
+        per_host=mbps_to_bytes(st.session_state.bandwidth_per_host_input),
+    ))
+
+def scheduled_job_for(video_url, format_option, clip=None):
+    """Descrição do vídeo para o agendador do lote: tamanho esperado, host e prioridade escolhida no card."""
+    return ScheduledJob(
+        key=video_url,
+        expected_bytes=expected_bytes(format_option, clip, st.session_state.processed_videos_data[video_url]['record'].duration),
+        host=urlparse(video_url).netloc,
+        priority=st.session_state.get(f"priority_{video_url}", 0),
+    )
+
+def download_renditions(video_url, format_options, output_filepaths, clip=None):
+    """
+    Baixa várias qualidades do mesmo vídeo de uma vez: uma única extração, o áudio compartilhado
+    baixado só uma vez e os streams de vídeo em paralelo, cada saída mesclada localmente.
+    """
+    renditions = tuple(
+        build_download_job(video_url, option, path, clip)
+        for option, path in zip(format_options, output_filepaths)
+    )
+    return get_download_engine().download(MultiRenditionJob(video_url, renditions))
+
+def download_video(video_url, format_option, output_filepath, clip=None):
+    """
+    Baixa o vídeo no formato escolhido para output_filepath (bloqueia até terminar).
+    Formatos apenas vídeo levam junto o áudio pareado, baixado em paralelo e mesclado no mesmo arquivo.
+    Retorna o caminho do arquivo: se o item já estava no catálogo, pode ser o arquivo existente.
+    """
+    return get_download_engine().download(build_download_job(video_url, format_option, output_filepath, clip))
+
+def apply_quality_profile(urls, profile_name=None):
+    """
+    Escolhe automaticamente o formato de cada vídeo (pendente) em `urls` segundo o perfil de qualidade,
+    numa única passada sobre o lote. Sem `profile_name`, usa o perfil ativo da barra lateral.
+    """
+    profiles = load_profiles(QUALITY_PROFILES_FILE)
+    policy = profiles.get(profile_name or st.session_state.active_quality_profile)
+    if policy is None:
+        return
+    records_by_url = {url: st.session_state.processed_videos_data[url]['record'] for url in urls}
+    selection = apply_policy(build_format_matrix(records_by_url), policy).to_dict()
+    for url, format_id in selection.items():
+        if st.session_state.download_statuses.get(url) == 'pending':
+            st.session_state[f"res_choice_{url}"] = format_id
 
 # --- Callbacks para atualização de estado ---
 def update_selected_videos_multiselect():
     st.session_state.selected_video_display_names = st.session_state.video_multiselect_value
 
+def download_archived_again(video_url):
+    """Volta um vídeo do arquivo de downloads para pendente, com a qualidade do perfil (antes de o seletor ser desenhado)."""
+    st.session_state.download_statuses[video_url] = 'pending'
+    apply_quality_profile([video_url])
+
 # --- Interface do Streamlit ---
 
 st.sidebar.header("Configurações do Aplicativo")
 st.session_state.app_mode = st.sidebar.radio(
     "Escolha o Modo:",
-    ("Procurar Links no Site", "Download Direto de Vídeo"),
+    ("Procurar Links no Site", "Download Direto de Vídeo", "Catálogo de Downloads"),
     key="app_mode_radio"
 )
 
@@ -172,6 +482,117 @@ st.sidebar.subheader("Detalhes de Nomeação dos Arquivos")
 st.session_state.base_name = st.sidebar.text_input("Nome Base para o Vídeo:", st.session_state.base_name, key="base_name_input_sidebar")
 st.session_state.base_number = st.sidebar.number_input("Número Base para o Vídeo (será incrementado):", min_value=1, value=st.session_state.base_number, key="base_number_input_sidebar")
 
+st.sidebar.subheader("Perfil de Qualidade")
+quality_profiles = load_profiles(QUALITY_PROFILES_FILE)
+if st.session_state.active_quality_profile not in quality_profiles:
+    st.session_state.active_quality_profile = next(iter(quality_profiles))
+profile_names = list(quality_profiles)
+st.session_state.active_quality_profile = st.sidebar.selectbox(
+    "Perfil aplicado ao processar os vídeos:",
+    options=profile_names,
+    index=profile_names.index(st.session_state.active_quality_profile),
+    key="active_quality_profile_select"
+)
+with st.sidebar.expander("Editar / criar perfil"):
+    editing_policy = quality_profiles[st.session_state.active_quality_profile]
+    height_options = [None, 2160, 1440, 1080, 720, 480, 360]
+    codec_options = [None] + list(CODEC_PREFIXES)
+    profile_name_input = st.text_input("Nome do perfil:", value=st.session_state.active_quality_profile, key="profile_name_input")
+    profile_max_height = st.selectbox(
+        "Altura máxima:",
+        options=height_options,
+        index=height_options.index(editing_policy.max_height) if editing_policy.max_height in height_options else 0,
+        format_func=lambda h: "Sem limite" if h is None else f"{h}p",
+        key=f"profile_max_height_{st.session_state.active_quality_profile}"
+    )
+    profile_prefer_combined = st.checkbox("Preferir formatos combinados (áudio + vídeo)", value=editing_policy.prefer_combined, key=f"profile_prefer_combined_{st.session_state.active_quality_profile}")
+    profile_prefer_vcodec = st.selectbox(
+        "Codec de vídeo preferido:",
+        options=codec_options,
+        index=codec_options.index(editing_policy.prefer_vcodec) if editing_policy.prefer_vcodec in codec_options else 0,
+        format_func=lambda c: "Qualquer" if c is None else c,
+        key=f"profile_prefer_vcodec_{st.session_state.active_quality_profile}"
+    )
+    profile_max_size_mb = st.number_input("Tamanho máximo por vídeo (MB, 0 = sem limite):", min_value=0, value=int(editing_policy.max_size_mb or 0), step=50, key=f"profile_max_size_mb_{st.session_state.active_quality_profile}")
+    profile_max_mb_per_minute = st.number_input("Máximo de MB por minuto de vídeo (0 = sem limite):", min_value=0.0, value=float(editing_policy.max_mb_per_minute or 0), step=1.0, key=f"profile_max_mb_per_minute_{st.session_state.active_quality_profile}")
+    st.caption("Vídeos sem nenhum formato dentro dos limites recebem o menor formato disponível.")
+    col_save, col_delete = st.columns(2)
+    with col_save:
+        if st.button("Salvar perfil", key="save_quality_profile_btn"):
+            if profile_name_input.strip():
+                save_profile(QUALITY_PROFILES_FILE, profile_name_input.strip(), QualityPolicy(
+                    max_height=profile_max_height,
+                    prefer_combined=profile_prefer_combined,
+                    max_size_mb=profile_max_size_mb or None,
+                    prefer_vcodec=profile_prefer_vcodec,
+                    max_mb_per_minute=profile_max_mb_per_minute or None,
+                ))
+                st.session_state.active_quality_profile = profile_name_input.strip()
+                del st.session_state["active_quality_profile_select"]
+                st.rerun()
+            else:
+                st.warning("Informe um nome para o perfil.")
+    with col_delete:
+        if st.button("Excluir perfil", key="delete_quality_profile_btn"):
+            delete_profile(QUALITY_PROFILES_FILE, st.session_state.active_quality_profile)
+            del st.session_state["active_quality_profile_select"]
+            st.rerun()
+
+st.sidebar.subheader("Desempenho")
+st.session_state.use_process_extraction = st.sidebar.checkbox("Extrair informações em processos separados (usa todos os núcleos)", value=st.session_state.use_process_extraction, key="use_process_extraction_checkbox")
+st.session_state.probe_missing_sizes = st.sidebar.checkbox("Estimar tamanhos ausentes consultando o servidor (HEAD/manifestos)", value=st.session_state.probe_missing_sizes, key="probe_missing_sizes_checkbox")
+# Pools e motor são compartilhados: os campos mostram os tamanhos em vigor e uma edição os redimensiona
+if st.session_state.use_process_extraction:
+    st.session_state.extraction_workers_input = get_extraction_process_pool().max_workers
+    st.sidebar.number_input("Processos de extração:", min_value=1, max_value=256, key="extraction_workers_input", on_change=resize_extraction_pool)
+st.session_state.parallel_downloads_input = get_download_engine().max_workers
+st.session_state.postprocess_workers_input = get_download_engine().postprocess_workers
+st.sidebar.number_input("Downloads simultâneos no lote:", min_value=1, max_value=16, key="parallel_downloads_input", on_change=resize_download_engine)
+st.sidebar.number_input("Mesclagens simultâneas (ffmpeg):", min_value=1, max_value=64, key="postprocess_workers_input", on_change=resize_download_engine)
+st.session_state.scheduling_mode = st.sidebar.selectbox(
+    "Ordem do lote:",
+    options=list(SCHEDULING_MODES),
+    index=list(SCHEDULING_MODES).index(st.session_state.scheduling_mode),
+    format_func=SCHEDULING_MODES.get,
+    key="scheduling_mode_select",
+)
+
+st.sidebar.subheader("Armazenamento")
+# Como na banda: os campos mostram os limites em vigor e só uma edição os muda (para todas as sessões)
+storage_limits = get_space_ledger().limits
+st.session_state.download_quota_gb_input = (storage_limits.quota_bytes or 0) / 1024 ** 3
+st.session_state.min_free_gb_input = storage_limits.min_free_bytes / 1024 ** 3
+st.sidebar.number_input("Cota da pasta de downloads (GB, 0 = sem cota):", min_value=0.0, step=1.0, key="download_quota_gb_input", on_change=apply_storage_limits)
+st.sidebar.number_input("Espaço livre mínimo no disco (GB):", min_value=0.0, step=0.5, key="min_free_gb_input", on_change=apply_storage_limits)
+st.sidebar.caption(f"Disponível para downloads: {get_space_ledger().available_bytes() / 1024 ** 3:.2f} GB")
+retention_manager = get_retention_manager()
+st.session_state.retention_max_gb_input = (retention_manager.policy.max_total_bytes or 0) / 1024 ** 3
+st.session_state.retention_max_days_input = (retention_manager.policy.max_age_seconds or 0) / 86400
+st.sidebar.number_input("Manter no máximo (GB de downloads, 0 = sem limite):", min_value=0.0, step=1.0, key="retention_max_gb_input", on_change=apply_retention_policy)
+st.sidebar.number_input("Remover downloads sem uso há (dias, 0 = nunca):", min_value=0.0, step=1.0, key="retention_max_days_input", on_change=apply_retention_policy)
+if retention_manager.evicted_files:
+    st.sidebar.caption(f"Removidos pela retenção: {retention_manager.evicted_files} arquivo(s), {retention_manager.evicted_bytes / (1024 * 1024):.2f} MB")
+if st.sidebar.button("Limpar downloads incompletos", key="janitor_sweep_btn"):
+    st.session_state.janitor_report = sweep(DOWNLOAD_DIR, get_job_journal())
+janitor_report = st.session_state.janitor_report or get_startup_janitor_report()
+if janitor_report.reclaimed_files or janitor_report.kept_files:
+    st.sidebar.caption(
+        f"Restos de downloads: {janitor_report.reclaimed_files} arquivo(s) removido(s) ({janitor_report.reclaimed_bytes / (1024 * 1024):.2f} MB liberados), "
+        f"{janitor_report.kept_files} mantido(s) para retomar ({janitor_report.kept_bytes / (1024 * 1024):.2f} MB)"
+    )
+st.session_state.skip_archived = st.sidebar.checkbox("Pular vídeos já baixados (arquivo de downloads)", value=st.session_state.skip_archived, key="skip_archived_checkbox")
+
+st.sidebar.subheader("Banda")
+# Os campos mostram os limites em vigor (valem para todas as sessões e podem ter sido mudados em outra);
+# uma edição vale também para os downloads já em andamento: a taxa de cada um é recalculada a cada bloco
+bandwidth_limits = get_bandwidth_shaper().limits
+st.session_state.bandwidth_total_input = bytes_to_mbps(bandwidth_limits.total)
+st.session_state.bandwidth_per_job_input = bytes_to_mbps(bandwidth_limits.per_job)
+st.session_state.bandwidth_per_host_input = bytes_to_mbps(bandwidth_limits.per_host)
+st.sidebar.number_input("Limite total (MB/s, 0 = sem limite):", min_value=0.0, step=0.5, key="bandwidth_total_input", on_change=apply_bandwidth_limits)
+st.sidebar.number_input("Limite por download (MB/s):", min_value=0.0, step=0.5, key="bandwidth_per_job_input", on_change=apply_bandwidth_limits)
+st.sidebar.number_input("Limite por host (MB/s):", min_value=0.0, step=0.5, key="bandwidth_per_host_input", on_change=apply_bandwidth_limits)
+
 
 if st.session_state.app_mode == "Procurar Links no Site":
     st.header("1. Procurar Links em Site")
@@ -184,6 +605,9 @@ if st.session_state.app_mode == "Procurar Links no Site":
         st.session_state.processed_videos_data = {}
         st.session_state.download_statuses = {}
         st.session_state.downloaded_files = {}
+        st.session_state.downloaded_renditions = {}
+        st.session_state.batch_futures = {}
+        st.session_state.batch_transfer_started = {}
         st.session_state.start_batch_download = False
         st.session_state.batch_download_in_progress = False
         
@@ -203,6 +627,12 @@ if st.session_state.app_mode == "Procurar Links no Site":
                     
                     if 'view_video' in full_href:
                         unique_video_urls.add(full_href)
+
+                # Vídeos já baixados em varreduras anteriores nem chegam à lista (nem os títulos são buscados)
+                known_urls = archived_urls(unique_video_urls)
+                if known_urls:
+                    unique_video_urls -= known_urls
+                    st.info(f"{len(known_urls)} link(s) já baixado(s) anteriormente foram ignorados (arquivo de downloads).")
                 
                 if unique_video_urls:
                     st.write("Obtendo títulos das páginas (isso pode levar um tempo, executando em paralelo)...")
@@ -231,6 +661,8 @@ if st.session_state.app_mode == "Procurar Links no Site":
                     progress_bar.empty()
                     progress_text.empty()
                     st.success(f"Encontrados e processados {len(st.session_state.available_video_options)} links únicos com 'view_video'.")
+                elif known_urls:
+                    st.success("Nenhum link novo: todos os vídeos desta página já foram baixados.")
                 else:
                     st.warning("Nenhum link com 'view_video' encontrado nesta página.")
             except requests.exceptions.RequestException as e:
@@ -254,14 +686,22 @@ if st.session_state.app_mode == "Procurar Links no Site":
             item for item in st.session_state.available_video_options
             if item[0] in st.session_state.selected_video_display_names
         ]
+        # O arquivo pode ter crescido desde a busca (ex.: outro lote terminou): não extrai de novo o que já foi baixado
+        known_urls = archived_urls(item[1] for item in selected_video_data)
+        selected_video_data = [item for item in selected_video_data if item[1] not in known_urls]
 
         if st.button("Processar Vídeos Selecionados", key="process_selected_videos"):
-            if not selected_video_data:
+            if not selected_video_data and known_urls:
+                st.info("Todos os vídeos selecionados já foram baixados anteriormente (arquivo de downloads).")
+            elif not selected_video_data:
                 st.warning("Por favor, selecione pelo menos um vídeo para processar.")
             else:
                 st.session_state.processed_videos_data = {}
                 st.session_state.download_statuses = {}
                 st.session_state.downloaded_files = {}
+                st.session_state.downloaded_renditions = {}
+                st.session_state.batch_futures = {}
+                st.session_state.batch_transfer_started = {}
                 st.session_state.batch_download_in_progress = False
 
                 st.info("Obtendo informações de vídeo (formatos e tamanhos) em paralelo...")
@@ -269,35 +709,32 @@ if st.session_state.app_mode == "Procurar Links no Site":
                 info_progress_text = st.empty()
                 total_selected = len(selected_video_data)
                 
-                with concurrent.futures.ThreadPoolExecutor(max_workers=5) as executor:
-                    future_to_video_item = {executor.submit(get_video_info, item[1]): item for item in selected_video_data}
+                executor = current_info_executor()
+                process_pool = current_process_pool()
+                future_to_video_item = {executor.submit(get_video_info, item[1], st.session_state.probe_missing_sizes, process_pool): item for item in selected_video_data}
+                
+                for idx, future in enumerate(concurrent.futures.as_completed(future_to_video_item)):
+                    video_item = future_to_video_item[future] # (display_string, url, page_title_raw)
+                    url = video_item[1]
+                    title_raw = video_item[2]
                     
-                    for idx, future in enumerate(concurrent.futures.as_completed(future_to_video_item)):
-                        video_item = future_to_video_item[future] # (display_string, url, page_title_raw)
-                        url = video_item[1]
-                        title_raw = video_item[2]
-                        
-                        video_info = future.result()
-                        current_video_number = st.session_state.base_number + idx 
-
-                        st.session_state.processed_videos_data[url] = {
-                            "display_name": video_item[0],
-                            "url": url,
-                            "page_title_raw": title_raw,
-                            "current_video_number": current_video_number,
-                            "video_info": video_info,
-                            "all_formats": parse_all_formats(video_info) if video_info else []
-                        }
-                        if video_info:
-                            st.session_state.download_statuses[url] = 'pending'
-                            # Salva a primeira opção como default para o radio de resolução
-                            if st.session_state.processed_videos_data[url]["all_formats"]:
-                                st.session_state[f"res_choice_{url}"] = st.session_state.processed_videos_data[url]["all_formats"][0]['display']
-                        else:
-                            st.session_state.download_statuses[url] = 'error_info_fetch'
+                    video_record = future.result()
+                    current_video_number = st.session_state.base_number + idx 
+
+                    st.session_state.processed_videos_data[url] = {
+                        "display_name": video_item[0],
+                        "url": url,
+                        "page_title_raw": title_raw,
+                        "current_video_number": current_video_number,
+                        "record": video_record # VideoRecord compacto (None se a extração falhou)
+                    }
+                    st.session_state.download_statuses[url] = initial_status(url, video_record)
+
+                    info_progress_bar.progress((idx + 1) / total_selected)
+                    info_progress_text.text(f"Processando informações de vídeo: {idx + 1}/{total_selected} vídeos.")
 
-                        info_progress_bar.progress((idx + 1) / total_selected)
-                        info_progress_text.text(f"Processando informações de vídeo: {idx + 1}/{total_selected} vídeos.")
+                # Escolhe as qualidades de todos os vídeos de uma vez, segundo o perfil ativo
+                apply_quality_profile(list(st.session_state.processed_videos_data))
 
                 info_progress_bar.empty()
                 info_progress_text.empty()
@@ -314,13 +751,16 @@ elif st.session_state.app_mode == "Download Direto de Vídeo":
             st.session_state.processed_videos_data = {}
             st.session_state.download_statuses = {}
             st.session_state.downloaded_files = {}
+            st.session_state.downloaded_renditions = {}
+            st.session_state.batch_futures = {}
+            st.session_state.batch_transfer_started = {}
             st.session_state.start_batch_download = False
             st.session_state.batch_download_in_progress = False
 
             st.info(f"Obtendo informações para: {st.session_state.direct_video_url}...")
             
             video_url = st.session_state.direct_video_url
-            video_info = get_video_info(video_url)
+            video_record = current_info_executor().submit(get_video_info, video_url, st.session_state.probe_missing_sizes, current_process_pool()).result()
             page_title_raw = get_page_title(video_url)
             
             st.session_state.processed_videos_data[video_url] = {
@@ -328,28 +768,117 @@ elif st.session_state.app_mode == "Download Direto de Vídeo":
                 "url": video_url,
                 "page_title_raw": page_title_raw,
                 "current_video_number": st.session_state.base_number,
-                "video_info": video_info,
-                "all_formats": parse_all_formats(video_info) if video_info else []
+                "record": video_record
             }
-            if video_info:
-                st.session_state.download_statuses[video_url] = 'pending'
-                if st.session_state.processed_videos_data[video_url]["all_formats"]:
-                    st.session_state[f"res_choice_{video_url}"] = st.session_state.processed_videos_data[video_url]["all_formats"][0]['display']
-            else:
-                st.session_state.download_statuses[video_url] = 'error_info_fetch'
+            st.session_state.download_statuses[video_url] = initial_status(video_url, video_record)
+            apply_quality_profile([video_url])
 
             st.success("Informações de vídeo processadas!")
             st.rerun()
         else:
             st.warning("Por favor, insira um link direto para o vídeo.")
 
-# --- Seção 3: Detalhes e Download dos Vídeos (Comum aos dois modos) ---
-if st.session_state.processed_videos_data:
+elif st.session_state.app_mode == "Catálogo de Downloads":
+    st.header("Catálogo de Downloads")
+    catalog = get_download_catalog()
+    search_col, size_col = st.columns([3, 1])
+    with search_col:
+        st.session_state.catalog_query = st.text_input("Buscar pelo título:", st.session_state.catalog_query, key="catalog_query_input")
+    with size_col:
+        catalog_page_size = st.selectbox("Itens por página:", CATALOG_PAGE_SIZES, key="catalog_page_size_select")
+
+    # A listagem vem só do índice do catálogo: nenhum arquivo do diretório de downloads é lido aqui
+    catalog_pages = max(1, -(-catalog.count(st.session_state.catalog_query) // catalog_page_size))
+    st.session_state.catalog_page = min(st.session_state.catalog_page, catalog_pages)
+    st.session_state.catalog_page = st.number_input(
+        f"Página (de {catalog_pages}):", min_value=1, max_value=catalog_pages,
+        value=st.session_state.catalog_page, key="catalog_page_input"
+    )
+    catalog_rows, catalog_total = catalog.search(
+        st.session_state.catalog_query, limit=catalog_page_size,
+        offset=(st.session_state.catalog_page - 1) * catalog_page_size
+    )
+    st.caption(f"{catalog_total} arquivo(s) no catálogo.")
+
+    if catalog_rows:
+        st.dataframe(
+            [{
+                "Título": row['title'] or os.path.basename(row['path']),
+                "Qualidade": row['format'] or row['format_id'],
+                "Tamanho (MB)": round((row['size'] or 0) / (1024 * 1024), 2),
+                "Duração": format_eta(row['duration']) if row['duration'] else "-",
+                "Baixado em": time.strftime("%Y-%m-%d %H:%M", time.localtime(row['created_at'])),
+                "Último acesso": time.strftime("%Y-%m-%d %H:%M", time.localtime(row['last_served_at'])) if row['last_served_at'] else "-",
+                "Origem": row['source_url'] or "-",
+                "Arquivo": row['path'],
+            } for row in catalog_rows],
+            hide_index=True
+        )
+        # Só o arquivo escolhido é aberto, e apenas quando o usuário pede
+        catalog_choice = st.selectbox(
+            "Arquivo:", range(len(catalog_rows)),
+            format_func=lambda i: catalog_rows[i]['title'] or os.path.basename(catalog_rows[i]['path']),
+            key="catalog_file_select"
+        )
+        chosen_path = catalog_rows[catalog_choice]['path']
+        chosen_filename = os.path.basename(chosen_path)
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button(f"Preparar '{chosen_filename}' para salvar", key="catalog_prepare_btn"):
+                if os.path.exists(chosen_path):
+                    with open(chosen_path, "rb") as fp:
+                        st.download_button(
+                            label=f"Clique para Salvar '{chosen_filename}'",
+                            data=fp.read(),
+                            file_name=chosen_filename,
+                            mime="video/mp4",
+                            key="catalog_serve_download",
+                            on_click=mark_served, args=(chosen_path,)
+                        )
+                else:
+                    st.error(f"Erro: O arquivo não foi encontrado em {chosen_path}.")
+        with col2:
+            if st.button(f"Reproduzir '{chosen_filename}'", key="catalog_play_btn"):
+                mark_served(chosen_path)
+                st.video(chosen_path)
+    elif st.session_state.catalog_query:
+        st.info("Nenhum download encontrado para essa busca.")
+    else:
+        st.info("Nenhum download concluído ainda.")
+
+# --- Seção 3: Detalhes e Download dos Vídeos (Comum aos dois modos de download) ---
+if st.session_state.app_mode == "Catálogo de Downloads":
+    pass # O catálogo ocupa a página inteira; os vídeos processados continuam na sessão
+elif st.session_state.processed_videos_data:
     st.header("3. Detalhes e Download dos Vídeos")
     
     sorted_processed_urls = sorted(st.session_state.processed_videos_data.keys(), 
                                    key=lambda u: st.session_state.processed_videos_data[u]['current_video_number'])
     
+    # --- Perfil de Qualidade e Total do Lote ---
+    if not st.session_state.batch_download_in_progress:
+        records_by_url = {url: st.session_state.processed_videos_data[url]['record'] for url in sorted_processed_urls}
+        format_matrix = build_format_matrix(records_by_url)
+        current_selection = {
+            url: st.session_state[f"res_choice_{url}"] for url in sorted_processed_urls
+            if records_by_url[url] and st.session_state.get(f"res_choice_{url}")
+        }
+        total_mb, unknown_count = summarize_selection(format_matrix, current_selection)
+        st.write(f"**Total a baixar com as qualidades atuais:** `{total_mb:.2f} MB`" + (f" ({unknown_count} vídeo(s) sem tamanho conhecido)" if unknown_count else ""))
+
+        if st.button(f"Reaplicar o perfil '{st.session_state.active_quality_profile}' a todos os vídeos pendentes", key="apply_quality_profile_btn"):
+            apply_quality_profile(sorted_processed_urls)
+            st.rerun()
+
+        with st.expander("Baixar só um trecho de todos os vídeos"):
+            st.caption("Instantes em segundos, mm:ss ou hh:mm:ss. Vazio = vídeo inteiro; o trecho definido no card de um vídeo tem prioridade.")
+            col_clip_start, col_clip_end = st.columns(2)
+            with col_clip_start:
+                st.session_state.batch_clip_start = st.text_input("Início:", st.session_state.batch_clip_start, key="batch_clip_start_input")
+            with col_clip_end:
+                st.session_state.batch_clip_end = st.text_input("Fim:", st.session_state.batch_clip_end, key="batch_clip_end_input")
+            st.session_state.batch_clip_exact = st.checkbox("Corte exato (recodifica as bordas; sem ele, o corte é no keyframe anterior)", value=st.session_state.batch_clip_exact, key="batch_clip_exact_checkbox")
+
     # --- Lógica de Download em Lote (Batch Download) ---
     if st.session_state.start_batch_download and not st.session_state.batch_download_in_progress:
         st.session_state.batch_download_in_progress = True
@@ -363,74 +892,125 @@ if st.session_state.processed_videos_data:
         
         total_videos_to_download = len(sorted_processed_urls)
         completed_downloads_count = 0
-        
-        for idx, video_url in enumerate(sorted_processed_urls):
+        deferred_for_space = []
+
+        def mark_processed(note=""):
+            """Conta mais um vídeo do lote como processado e atualiza a barra de progresso."""
+            global completed_downloads_count
+            completed_downloads_count += 1
+            batch_progress_bar.progress(completed_downloads_count / total_videos_to_download)
+            batch_status_text.text(f"Baixando vídeos: {completed_downloads_count}/{total_videos_to_download} concluídos{note}.")
+
+        # Monta os jobs pendentes (vídeos com status final já contam como processados)
+        batch_jobs = {} # url -> (opção escolhida, nome do arquivo, caminho, trecho)
+        for video_url in sorted_processed_urls:
             video_data = st.session_state.processed_videos_data[video_url]
             current_download_status = st.session_state.download_statuses.get(video_url)
-            
-            if current_download_status in ('completed', 'error', 'error_info_fetch'):
-                completed_downloads_count += 1
-                batch_progress_bar.progress(completed_downloads_count / total_videos_to_download)
-                batch_status_text.text(f"Baixando vídeos: {completed_downloads_count}/{total_videos_to_download} concluídos (ou com status final).")
+
+            if current_download_status in ('completed', 'error', 'error_info_fetch', 'rejected_space', 'archived'):
+                mark_processed(" (ou com status final)")
                 continue # Pula vídeos já processados
-            
-            # Pega a resolução escolhida que foi salva no st.session_state
-            chosen_display_format = st.session_state.get(f"res_choice_{video_url}", None)
-            
-            if not chosen_display_format:
+            if video_url in st.session_state.batch_futures:
+                continue # Já está baixando (o script foi re-executado no meio do lote, ex.: ao mudar a banda)
+
+            # Pega o format_id escolhido que foi salvo no st.session_state
+            chosen_format_id = st.session_state.get(f"res_choice_{video_url}", None)
+
+            if not chosen_format_id:
                 st.error(f"Nenhuma qualidade selecionada para o vídeo {video_data['page_title_raw']}. Pulando.")
                 st.session_state.download_statuses[video_url] = 'error'
-                completed_downloads_count += 1
-                batch_progress_bar.progress(completed_downloads_count / total_videos_to_download)
+                mark_processed(" (com erro)")
                 continue
 
-            # Encontrar o format_id correspondente
-            selected_format_info = next((f for f in video_data['all_formats'] if f['display'] == chosen_display_format), None)
-            
+            # Encontrar a opção correspondente
+            selected_format_info = video_data['record'].formats.get(chosen_format_id)
+
             if not selected_format_info:
-                st.error(f"Qualidade selecionada '{chosen_display_format}' não encontrada para {video_data['page_title_raw']}. Pulando.")
+                st.error(f"Qualidade selecionada '{chosen_format_id}' não encontrada para {video_data['page_title_raw']}. Pulando.")
                 st.session_state.download_statuses[video_url] = 'error'
-                completed_downloads_count += 1
-                batch_progress_bar.progress(completed_downloads_count / total_videos_to_download)
+                mark_processed(" (com erro)")
                 continue
 
-            chosen_format_id = selected_format_info['format_id']
-            
-            page_title_raw = video_data['page_title_raw']
-            clean_page_title = clean_filename(page_title_raw)
-            final_filename_base = f"{st.session_state.base_name}{video_data['current_video_number']} {clean_page_title}"
-            output_filename = f"{final_filename_base}_{chosen_display_format.split(' - ')[0]}.mp4" # Usa parte da string de display
-            output_filepath = os.path.join(DOWNLOAD_DIR, output_filename)
-
-            st.session_state.download_statuses[video_url] = 'downloading'
-            batch_status_text.text(f"Baixando ({completed_downloads_count+1}/{total_videos_to_download}): '{output_filename}'...")
-            
             try:
-                # Usar o format_id específico para o yt-dlp
-                ydl_opts = {
-                    'format': chosen_format_id,
-                    'outtmpl': output_filepath,
-                    'noplaylist': True,
-                    'quiet': True,
-                    'retries': 5,
-                    'merge_output_format': 'mp4' # Força a mesclagem para mp4 se for vídeo+áudio separado
-                }
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    ydl.download([video_url])
-                
-                st.session_state.download_statuses[video_url] = 'completed'
-                st.session_state.downloaded_files[video_url] = output_filepath
-                completed_downloads_count += 1
-                batch_progress_bar.progress(completed_downloads_count / total_videos_to_download)
-                batch_status_text.text(f"Baixando vídeos: {completed_downloads_count}/{total_videos_to_download} concluídos.")
-            except Exception as e:
-                st.error(f"Erro ao baixar '{output_filename}': {e}")
+                clip = clip_for(video_url)
+            except ValueError as e:
+                st.error(f"Trecho inválido para o vídeo {video_data['page_title_raw']}: {e} Pulando.")
                 st.session_state.download_statuses[video_url] = 'error'
-                completed_downloads_count += 1 # Conta como processado, mesmo com erro
-                batch_progress_bar.progress(completed_downloads_count / total_videos_to_download)
-                batch_status_text.text(f"Baixando vídeos: {completed_downloads_count}/{total_videos_to_download} concluídos (com erro).")
+                mark_processed(" (com erro)")
+                continue
+
+            output_filename = build_output_filename(video_data, selected_format_info, clip)
+            batch_jobs[video_url] = (selected_format_info, output_filename, os.path.join(DOWNLOAD_DIR, output_filename), clip)
+
+        # Admissão por espaço: rejeita o que nunca caberia e adia (para o fim do lote) o que não cabe agora.
+        # Conta o pico de espaço de cada download (o mesmo que o DownloadEngine reserva), não o tamanho final
+        batch_plan = plan_batch([(url, build_download_job(url, option, path, clip).peak_bytes) for url, (option, _, path, clip) in batch_jobs.items()], get_space_ledger())
+        for video_url in batch_plan.rejected:
+            st.session_state.download_statuses[video_url] = 'rejected_space'
+            del batch_jobs[video_url]
+            mark_processed(" (sem espaço)")
+        if batch_plan.deferred or batch_plan.rejected:
+            st.warning(
+                f"Espaço: {len(batch_plan.admitted)} vídeo(s) admitido(s) ({batch_plan.admitted_bytes / (1024 * 1024):.2f} MB), "
+                f"{len(batch_plan.deferred)} adiado(s) para o fim do lote e {len(batch_plan.rejected)} rejeitado(s) por não caber(em) no disco/cota."
+            )
+
+        # Ordem de despacho: os admitidos e depois os adiados, cada grupo ordenado pelo modo escolhido
+        throughput_meter = get_throughput_meter()
+        scheduled = {url: scheduled_job_for(url, option, clip) for url, (option, _, _, clip) in batch_jobs.items()}
+        dispatch_order = (
+            schedule_batch([scheduled[url] for url in batch_plan.admitted], st.session_state.scheduling_mode, throughput_meter)
+            + schedule_batch([scheduled[url] for url in batch_plan.deferred], st.session_state.scheduling_mode, throughput_meter)
+        )
+
+        engine = get_download_engine()
+        transfer_started = st.session_state.batch_transfer_started # O ETA conta o tempo de cada download a partir da vaga, não da fila
+        for scheduled_job in dispatch_order:
+            option, _, output_filepath, clip = batch_jobs[scheduled_job.key]
+            st.session_state.download_statuses[scheduled_job.key] = 'downloading'
+            future = engine.submit(
+                build_download_job(scheduled_job.key, option, output_filepath, clip),
+                on_transfer_start=lambda key=scheduled_job.key: transfer_started.setdefault(key, time.monotonic()),
+            )
+            st.session_state.batch_futures[scheduled_job.key] = (future, scheduled_job, output_filepath)
+        futures = {future: scheduled_job for future, scheduled_job, _ in st.session_state.batch_futures.values()}
+
+        # Acompanha os downloads paralelos, atualizando o progresso e o ETA do lote
+        not_done = set(futures)
+        while not_done:
+            done, not_done = concurrent.futures.wait(not_done, timeout=1, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                video_url = futures[future].key
+                _, _, output_filepath = st.session_state.batch_futures.pop(video_url)
+                transfer_started.pop(video_url, None)
+                output_filename = os.path.basename(output_filepath)
+                try:
+                    st.session_state.downloaded_files[video_url] = future.result()
+                    st.session_state.download_statuses[video_url] = 'completed'
+                    mark_processed()
+                except InsufficientSpaceError:
+                    # Continua pendente: pode ser baixado depois, quando houver espaço
+                    st.session_state.download_statuses[video_url] = 'pending'
+                    deferred_for_space.append(output_filename)
+                    mark_processed(" (sem espaço)")
+                except Exception as e:
+                    st.error(f"Erro ao baixar '{output_filename}': {e}")
+                    st.session_state.download_statuses[video_url] = 'error'
+                    mark_processed(" (com erro)")
+            if not not_done:
+                break
+            now = time.monotonic()
+            running = [(futures[future], now - transfer_started[futures[future].key]) for future in not_done if futures[future].key in transfer_started]
+            queued = [scheduled_job for future, scheduled_job in futures.items() if future in not_done and scheduled_job.key not in transfer_started]
+            eta_seconds = estimate_batch_eta(queued, running, engine.max_workers, throughput_meter)
+            batch_status_text.text(
+                f"Baixando {len(running)} vídeo(s) em paralelo, {len(queued)} na fila "
+                f"({completed_downloads_count}/{total_videos_to_download} concluídos) - ETA do lote: {format_eta(eta_seconds)}"
+            )
 
         st.session_state.batch_download_in_progress = False
+        if deferred_for_space:
+            st.warning(f"Sem espaço no momento para {len(deferred_for_space)} vídeo(s), que continuam pendentes: {', '.join(deferred_for_space)}")
         st.success("Download em lote concluído. Verifique o status de cada vídeo abaixo.")
         st.rerun() # Refresh UI to show final states
     else:
@@ -448,82 +1028,142 @@ if st.session_state.processed_videos_data:
         video_data = st.session_state.processed_videos_data[video_url]
         page_title_raw = video_data['page_title_raw']
         clean_page_title = clean_filename(page_title_raw)
-        video_info = video_data['video_info']
+        video_record = video_data['record']
         current_video_number = video_data['current_video_number']
-        all_formats_for_video = video_data['all_formats']
+        all_formats_for_video = video_record.formats if video_record else ()
 
         st.subheader(f"Vídeo {current_video_number}: {page_title_raw}")
         st.markdown(f"URL: `{video_url}`")
         
         download_status = st.session_state.download_statuses.get(video_url, 'pending')
 
-        if video_info:
+        if video_record:
             if not all_formats_for_video:
                 st.warning("Nenhuma qualidade de vídeo disponível detectada para esta URL.")
                 st.markdown("---")
                 continue
 
-            # Garante que a escolha de resolução persista
-            default_display_format = st.session_state.get(f"res_choice_{video_url}", all_formats_for_video[0]['display'])
+            # Garante que a escolha de resolução persista (o widget guarda o format_id, não o texto exibido)
+            default_format_id = st.session_state.get(f"res_choice_{video_url}", all_formats_for_video[0].format_id)
             
             # Usar st.selectbox para mostrar todas as opções de qualidade
-            chosen_display_format = st.selectbox(
+            chosen_format_id = st.selectbox(
                 f"Selecione a qualidade para o vídeo {current_video_number}:",
-                options=[f['display'] for f in all_formats_for_video],
-                index=[f['display'] for f in all_formats_for_video].index(default_display_format) if default_display_format in [f['display'] for f in all_formats_for_video] else 0,
+                options=all_formats_for_video.ids(),
+                index=all_formats_for_video.position(default_format_id),
+                format_func=lambda format_id, formats=all_formats_for_video: formats.get(format_id).display,
                 key=f"res_choice_{video_url}"
             )
             
-            # Encontrar o format_id correspondente
-            selected_format_info = next((f for f in all_formats_for_video if f['display'] == chosen_display_format), None)
+            # Encontrar a opção correspondente
+            selected_format_info = all_formats_for_video.get(chosen_format_id)
             
             if not selected_format_info:
-                st.error(f"Erro: Qualidade selecionada '{chosen_display_format}' não encontrada na lista de formatos disponíveis.")
+                st.error(f"Erro: Qualidade selecionada '{chosen_format_id}' não encontrada na lista de formatos disponíveis.")
                 st.markdown("---")
                 continue
             
-            chosen_format_id = selected_format_info['format_id']
-            chosen_resolution_height = selected_format_info['height']
+            chosen_display_format = selected_format_info.display
+            chosen_resolution_height = selected_format_info.height
+
+            with st.expander("Baixar só um trecho deste vídeo"):
+                col_clip_start, col_clip_end = st.columns(2)
+                with col_clip_start:
+                    video_data['clip_start'] = st.text_input("Início:", video_data.get('clip_start', ''), key=f"clip_start_{video_url}")
+                with col_clip_end:
+                    video_data['clip_end'] = st.text_input("Fim:", video_data.get('clip_end', ''), key=f"clip_end_{video_url}")
+                video_data['clip_exact'] = st.checkbox("Corte exato (recodifica as bordas)", value=video_data.get('clip_exact', False), key=f"clip_exact_{video_url}")
+            clip_invalid = False
+            try:
+                clip = clip_for(video_url)
+            except ValueError as e:
+                # O resto do cartão continua (arquivos já baixados, pré-visualização); só o download fica bloqueado
+                st.error(f"Trecho inválido: {e}")
+                clip, clip_invalid = None, True
             
-            # Nome de arquivo baseado na qualidade selecionada
-            filename_qual_part = chosen_display_format.split(' - ')[0] # Pega "1080p@30fps" ou "720p"
-            final_filename_base = f"{st.session_state.base_name}{current_video_number} {clean_page_title}"
-            output_filename = f"{final_filename_base}_{filename_qual_part}.mp4"
+            # Nome de arquivo baseado na qualidade selecionada (e no trecho, se houver)
+            output_filename = build_output_filename(video_data, selected_format_info, clip)
             output_filepath = os.path.join(DOWNLOAD_DIR, output_filename)
             
             st.info(f"O vídeo será salvo como: `{output_filename}`")
+            if st.checkbox(f"Pré-visualizar '{chosen_display_format}' (sem baixar)", key=f"preview_{video_url}"):
+                try:
+                    with st.spinner("Preparando a pré-visualização..."):
+                        source = get_preview_source(video_url, chosen_format_id)
+                except yt_dlp.utils.DownloadError as e:
+                    source = None
+                    st.error(f"Não foi possível pré-visualizar este formato: {e}")
+                else:
+                    if source is None:
+                        st.info("Pré-visualização disponível só para formatos progressivos (HTTP); escolha outra qualidade ou baixe o vídeo.")
+                if source is not None:
+                    preview_url, preview_headers = source
+                    st.video(
+                        preview_proxy_url(get_preview_proxy().register(preview_url, preview_headers)),
+                        start_time=clip.start if clip else 0, # Com um trecho definido, toca só o trecho
+                        end_time=clip.end if clip else None,
+                    )
+                    if not selected_format_info.is_combined:
+                        st.caption("Formato só de vídeo: a pré-visualização não tem áudio (o áudio é mesclado no download).")
+            if clip:
+                clip_size = expected_bytes(selected_format_info, clip, video_record.duration)
+                st.caption(
+                    f"Trecho {clip.label}: só os segmentos/bytes do trecho são baixados"
+                    + (f" (~{clip_size / (1024 * 1024):.2f} MB de {selected_format_info.filesize_mb:.2f} MB)." if clip_size is not None else ".")
+                )
+            if st.session_state.scheduling_mode == 'priority' and download_status == 'pending':
+                st.number_input("Prioridade no lote (maior baixa primeiro):", min_value=-10, max_value=10, value=0, key=f"priority_{video_url}")
 
             # --- Lógica do Botão de Download Individual ---
             if download_status == 'pending':
-                if st.button(f"Baixar '{chosen_display_format}' de '{clean_page_title}'", key=f"download_btn_{video_url}"):
+                if st.button(f"Baixar '{chosen_display_format}' de '{clean_page_title}'", key=f"download_btn_{video_url}", disabled=clip_invalid):
                     st.session_state.download_statuses[video_url] = 'downloading'
                     st.session_state.processed_videos_data[video_url]['output_filepath'] = output_filepath
                     st.session_state.processed_videos_data[video_url]['chosen_format_id'] = chosen_format_id
                     st.session_state.processed_videos_data[video_url]['output_filename'] = output_filename
                     st.rerun()
+
+                with st.expander("Baixar várias qualidades deste vídeo"):
+                    rendition_format_ids = st.multiselect(
+                        "Qualidades a baixar (o áudio compartilhado é baixado uma única vez):",
+                        options=all_formats_for_video.ids(),
+                        format_func=lambda format_id, formats=all_formats_for_video: formats.get(format_id).display,
+                        key=f"renditions_choice_{video_url}"
+                    )
+                    if st.button("Baixar qualidades selecionadas", key=f"download_renditions_btn_{video_url}", disabled=clip_invalid):
+                        if not rendition_format_ids:
+                            st.warning("Selecione pelo menos uma qualidade.")
+                        else:
+                            rendition_options = [all_formats_for_video.get(format_id) for format_id in rendition_format_ids]
+                            rendition_paths = [os.path.join(DOWNLOAD_DIR, build_output_filename(video_data, option, clip)) for option in rendition_options]
+                            try:
+                                with st.spinner(f"Baixando {len(rendition_paths)} qualidades de '{clean_page_title}'..."):
+                                    rendition_paths = download_renditions(video_url, rendition_options, rendition_paths, clip)
+                                st.session_state.downloaded_renditions[video_url] = rendition_paths
+                                st.rerun()
+                            except Exception as e:
+                                st.error(f"Erro ao baixar as qualidades de '{clean_page_title}': {e}")
             elif download_status == 'downloading':
                 st.info(f"Download de '{output_filename}' em progresso...")
                 try:
-                    ydl_opts = {
-                        'format': chosen_format_id,
-                        'outtmpl': output_filepath,
-                        'noplaylist': True,
-                        'quiet': True,
-                        'retries': 5,
-                        'merge_output_format': 'mp4'
-                    }
                     with st.spinner(f"Baixando {output_filename}... Por favor, aguarde."):
-                        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                            ydl.download([video_url])
+                        downloaded_path = download_video(video_url, selected_format_info, output_filepath, clip)
                     
                     st.success(f"Vídeo '{output_filename}' baixado com sucesso!")
                     st.session_state.download_statuses[video_url] = 'completed'
-                    st.session_state.downloaded_files[video_url] = output_filepath
+                    st.session_state.downloaded_files[video_url] = downloaded_path
                     st.rerun()
+                except InsufficientSpaceError as e:
+                    st.warning(f"Download de '{output_filename}' adiado: {e}")
+                    st.session_state.download_statuses[video_url] = 'pending'
                 except yt_dlp.utils.DownloadError as e:
                     st.error(f"Erro ao baixar o vídeo {output_filename}: {e}")
                     st.session_state.download_statuses[video_url] = 'error'
                     st.rerun()
+                except CorruptDownloadError as e:
+                    st.error(f"O arquivo '{output_filename}' continuou corrompido depois de baixado de novo: {e}")
+                    st.session_state.download_statuses[video_url] = 'error'
+                    st.rerun()
                 except Exception as e:
                     st.error(f"Ocorreu um erro inesperado ao baixar '{output_filename}': {e}")
                     st.session_state.download_statuses[video_url] = 'error'
@@ -535,6 +1175,9 @@ if st.session_state.processed_videos_data:
                     file_size_bytes = os.path.getsize(downloaded_file_path)
                     file_size_mb = file_size_bytes / (1024 * 1024)
                     st.write(f"**Tamanho do arquivo baixado:** `{file_size_mb:.2f} MB`")
+                    file_checksum = get_download_catalog().sha256_of(downloaded_file_path)
+                    if file_checksum:
+                        st.write(f"**SHA-256:** `{file_checksum}`")
                     
                     col1, col2 = st.columns(2)
                     with col1:
@@ -544,13 +1187,23 @@ if st.session_state.processed_videos_data:
                                 data=fp.read(),
                                 file_name=output_filename,
                                 mime="video/mp4",
-                                key=f"serve_download_{video_url}"
+                                key=f"serve_download_{video_url}",
+                                on_click=mark_served, args=(downloaded_file_path,)
                             )
                     with col2:
                         if st.button(f"Reproduzir '{output_filename}'", key=f"play_video_{video_url}"):
+                            mark_served(downloaded_file_path)
                             st.video(downloaded_file_path)
                 else:
                     st.error(f"Erro: O arquivo baixado não foi encontrado em {downloaded_file_path}. Por favor, verifique o diretório 'downloads'.")
+            elif download_status == 'archived':
+                st.info(f"'{clean_page_title}' já foi baixado anteriormente (arquivo de downloads).")
+                st.button(f"Baixar Novamente '{clean_page_title}'", key=f"download_archived_btn_{video_url}", on_click=download_archived_again, args=(video_url,))
+            elif download_status == 'rejected_space':
+                st.error(f"'{output_filename}' não cabe no disco ou na cota da pasta de downloads. Escolha uma qualidade menor ou ajuste os limites de armazenamento.")
+                if st.button(f"Tentar Novamente '{clean_page_title}'", key=f"retry_space_btn_{video_url}"):
+                    st.session_state.download_statuses[video_url] = 'pending'
+                    st.rerun()
             elif download_status == 'error' or download_status == 'error_info_fetch':
                 st.error(f"Ocorreu um erro no download ou na obtenção de informações para este vídeo. Por favor, tente novamente ou verifique a URL.")
                 if st.button(f"Tentar Novamente '{clean_page_title}'", key=f"retry_download_btn_{video_url}"):
@@ -558,20 +1211,32 @@ if st.session_state.processed_videos_data:
                     get_video_info.clear() 
                     st.session_state.download_statuses[video_url] = 'pending'
                     st.rerun()
+
+            # Qualidades extras baixadas pelo modo "várias qualidades"
+            for rendition_path in st.session_state.downloaded_renditions.get(video_url, []):
+                if os.path.exists(rendition_path):
+                    rendition_filename = os.path.basename(rendition_path)
+                    with open(rendition_path, "rb") as fp:
+                        st.download_button(
+                            label=f"Clique para Salvar '{rendition_filename}'",
+                            data=fp.read(),
+                            file_name=rendition_filename,
+                            mime="video/mp4",
+                            key=f"serve_rendition_{video_url}_{rendition_filename}",
+                            on_click=mark_served, args=(rendition_path,)
+                        )
             
             st.markdown("---")
-        else: # Se video_info for None (erro ao buscar informações)
+        else: # Se o registro for None (erro ao buscar informações)
             st.warning(f"Não foi possível obter informações de vídeo para: {video_url}. Ignorando este vídeo.")
             if download_status == 'error_info_fetch':
                  if st.button(f"Tentar Novamente Obter Info '{clean_page_title}'", key=f"retry_info_btn_{video_url}"):
                     get_video_info.clear() 
                     # Tenta re-obter info e reprocessa
-                    video_data['video_info'] = get_video_info(video_url) 
-                    video_data['all_formats'] = parse_all_formats(video_data['video_info']) if video_data['video_info'] else []
-                    if video_data['video_info']:
+                    video_data['record'] = current_info_executor().submit(get_video_info, video_url, st.session_state.probe_missing_sizes, current_process_pool()).result()
+                    if video_data['record']:
                          st.session_state.download_statuses[video_url] = 'pending'
-                         if video_data["all_formats"]:
-                            st.session_state[f"res_choice_{video_url}"] = video_data["all_formats"][0]['display']
+                         apply_quality_profile([video_url])
                     st.rerun()
             st.markdown("---")
 
@@ -0,0 +1,109 @@
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+BURST_SECONDS = 1.0 # Quanto de "crédito" ocioso um download pode acumular e gastar de uma vez
+
+
+@dataclass(frozen=True)
+class BandwidthLimits:
+    """Limites de banda em bytes/s; None = sem limite naquele nível."""
+    total: int = None # Soma de todos os downloads do aplicativo
+    per_job: int = None # Cada download individualmente
+    per_host: int = None # Todos os downloads de um mesmo host somados
+
+
+class Flow:
+    """
+    Um download em andamento sob o BandwidthShaper. Usado como progress hook do yt-dlp:
+    a cada bloco recebido, desconta os bytes novos e dorme o necessário para respeitar a sua taxa.
+    """
+
+    def __init__(self, shaper, host, weight):
+        self.shaper = shaper
+        self.host = host
+        self.weight = weight
+        self._lock = threading.Lock()
+        self._seen = {} # arquivo -> bytes já contabilizados (downloaded_bytes é cumulativo)
+        self._tokens = 0.0
+        self._last = time.monotonic()
+
+    def __call__(self, status):
+        if status.get('status') not in ('downloading', 'finished'):
+            return
+        name = status.get('tmpfilename') or status.get('filename')
+        downloaded = status.get('downloaded_bytes') or 0
+        with self._lock:
+            # A primeira leitura de cada arquivo só marca a base (pode ser retomada de um .part existente).
+            # Conexões paralelas do mesmo arquivo podem reportar totais fora de ordem: um valor menor é ignorado
+            previous = self._seen.get(name, downloaded)
+            self._seen[name] = max(previous, downloaded)
+        if downloaded > previous:
+            self.consume(downloaded - previous)
+
+    def __deepcopy__(self, memo):
+        return self # Compartilhado entre as instâncias; YdlPool.lease copia as opções com deepcopy
+
+    def consume(self, nbytes):
+        """Desconta `nbytes` do balde desta transferência, dormindo se ela estiver acima da sua taxa."""
+        rate = self.shaper.rate_for(self)
+        if rate is None:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self._tokens + (now - self._last) * rate, rate * BURST_SECONDS) - nbytes
+            self._last = now
+            wait = -self._tokens / rate if self._tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+
+class BandwidthShaper:
+    """
+    Divide um orçamento global de banda entre os downloads ativos, proporcionalmente ao peso de cada um.
+
+    A taxa de cada download é o menor entre: sua fatia do total, sua fatia do limite do seu host
+    (dividido entre os downloads daquele host) e o limite por download. Ela é recalculada a cada
+    bloco, então mudanças em configure() e a entrada/saída de downloads valem imediatamente.
+    """
+
+    def __init__(self, limits=None):
+        self.limits = limits or BandwidthLimits()
+        self._lock = threading.Lock()
+        self._flows = set()
+
+    def configure(self, limits):
+        self.limits = limits
+
+    @contextmanager
+    def flow(self, host, weight=1.0):
+        """Registra um download ativo durante o bloco e entrega o Flow (o progress hook) dele."""
+        flow = Flow(self, host, max(weight, 0.01))
+        with self._lock:
+            self._flows.add(flow)
+        try:
+            yield flow
+        finally:
+            with self._lock:
+                self._flows.discard(flow)
+
+    def active_flows(self):
+        with self._lock:
+            return len(self._flows)
+
+    def rate_for(self, flow):
+        """Taxa atual (bytes/s) permitida para o download, ou None se nada o limita."""
+        limits = self.limits
+        rates = []
+        if limits.per_job:
+            rates.append(limits.per_job)
+        if limits.total or limits.per_host:
+            with self._lock:
+                total_weight = sum(f.weight for f in self._flows) or flow.weight
+                host_weight = sum(f.weight for f in self._flows if f.host == flow.host) or flow.weight
+            if limits.total:
+                rates.append(limits.total * flow.weight / total_weight)
+            if limits.per_host:
+                rates.append(limits.per_host * flow.weight / host_weight)
+        return min(rates) if rates else None
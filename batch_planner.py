@@ -0,0 +1,249 @@
+import heapq
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+
+class InsufficientSpaceError(Exception):
+    """Não há espaço (livre no volume ou dentro da cota) para reservar o tamanho esperado do download."""
+
+
+@dataclass(frozen=True)
+class StorageLimits:
+    """Limites de armazenamento para o diretório de downloads."""
+    quota_bytes: int = None # Máximo que o diretório pode ocupar; None = sem cota
+    min_free_bytes: int = 0 # Folga que deve sobrar no volume
+
+
+@dataclass
+class BatchPlan:
+    """Resultado da admissão do lote: chaves admitidas, adiadas (não cabem agora) e rejeitadas (nunca cabem)."""
+    admitted: list = field(default_factory=list)
+    deferred: list = field(default_factory=list)
+    rejected: list = field(default_factory=list)
+    admitted_bytes: int = 0
+    unknown_size: list = field(default_factory=list) # Admitidas sem tamanho conhecido (não reservam espaço)
+
+
+# Modos de ordenação do lote
+SCHEDULING_MODES = {
+    'sjf': "Menores primeiro (SJF)",
+    'fifo': "Ordem da lista (FIFO)",
+    'priority': "Por prioridade",
+}
+
+DEFAULT_THROUGHPUT = 2 * 1024 * 1024 # Bytes/s assumidos para hosts ainda sem medição
+DIRECTORY_SCAN_SECONDS = 30 # Validade da soma do diretório de downloads no SpaceLedger (varrê-lo custa caro)
+
+
+@dataclass(frozen=True)
+class ScheduledJob:
+    """Um vídeo do lote a agendar: `host` escolhe a vazão medida e `priority` maior sai antes no modo prioridade."""
+    key: str
+    expected_bytes: int = None
+    host: str = None
+    priority: int = 0
+
+
+def directory_size(directory):
+    """Soma o tamanho dos arquivos diretamente dentro do diretório (hard links do mesmo arquivo contam uma vez)."""
+    total = 0
+    seen = set()
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_file(follow_symlinks=False):
+                stat = entry.stat(follow_symlinks=False)
+                if (stat.st_dev, stat.st_ino) not in seen:
+                    seen.add((stat.st_dev, stat.st_ino))
+                    total += stat.st_size
+    return total
+
+
+class SpaceLedger:
+    """
+    Contabiliza o espaço reservado pelos downloads em andamento, compartilhado entre sessões e threads.
+
+    Cada download reserva o tamanho esperado antes de começar e libera ao terminar. A conta é
+    conservadora: enquanto o arquivo cresce, os bytes já gravados ainda contam também na reserva.
+    O tamanho do diretório (para a cota) é guardado e só recalculado quando vence ou quando uma reserva
+    é liberada, que é quando os bytes do download passam a contar no diretório em vez de na reserva.
+    """
+
+    def __init__(self, directory, limits=None):
+        self.directory = directory
+        self.limits = limits or StorageLimits()
+        self._lock = threading.Lock()
+        self._reservations = {}
+        self._directory_bytes = 0
+        self._scanned_at = None # time.monotonic() da última soma do diretório; None = recalcular
+
+    def configure(self, limits):
+        self.limits = limits
+
+    def reserved_bytes(self):
+        with self._lock:
+            return sum(self._reservations.values())
+
+    def available_bytes(self):
+        """Bytes que ainda podem ser reservados agora, respeitando a folga do volume e a cota."""
+        with self._lock:
+            return self._available_locked()
+
+    def capacity_bytes(self):
+        """Maior download que poderia caber com o diretório vazio e sem reservas (acima disso, nunca cabe)."""
+        usage = shutil.disk_usage(self.directory)
+        with self._lock:
+            used = self._directory_size_locked()
+        capacity = usage.free + used - self.limits.min_free_bytes
+        if self.limits.quota_bytes:
+            capacity = min(capacity, self.limits.quota_bytes)
+        return max(capacity, 0)
+
+    def try_reserve(self, key, nbytes):
+        """Reserva `nbytes` para `key` se couber; retorna False caso contrário."""
+        with self._lock:
+            if nbytes and nbytes > self._available_locked():
+                return False
+            self._reservations[key] = nbytes or 0
+            return True
+
+    def release(self, key):
+        with self._lock:
+            self._reservations.pop(key, None)
+            self._scanned_at = None
+
+    @contextmanager
+    def reservation(self, key, nbytes):
+        """Mantém a reserva durante o bloco; levanta InsufficientSpaceError se não couber."""
+        if not self.try_reserve(key, nbytes):
+            raise InsufficientSpaceError(
+                f"Espaço insuficiente para {nbytes / (1024 * 1024):.2f} MB "
+                f"(disponível: {self.available_bytes() / (1024 * 1024):.2f} MB)."
+            )
+        try:
+            yield
+        finally:
+            self.release(key)
+
+    def _available_locked(self):
+        reserved = sum(self._reservations.values())
+        available = shutil.disk_usage(self.directory).free - self.limits.min_free_bytes - reserved
+        if self.limits.quota_bytes:
+            available = min(available, self.limits.quota_bytes - self._directory_size_locked() - reserved)
+        return max(available, 0)
+
+    def _directory_size_locked(self):
+        now = time.monotonic()
+        if self._scanned_at is None or now - self._scanned_at > DIRECTORY_SCAN_SECONDS:
+            self._directory_bytes = directory_size(self.directory)
+            self._scanned_at = now
+        return self._directory_bytes
+
+
+def plan_batch(jobs, ledger):
+    """
+    Decide a admissão do lote: `jobs` é uma lista de (chave, bytes_esperados ou None), na ordem do lote.
+    Admite enquanto couber no espaço disponível, adia o que não cabe agora e rejeita o que nunca caberia.
+    """
+    plan = BatchPlan()
+    budget = ledger.available_bytes()
+    capacity = ledger.capacity_bytes()
+    for key, expected_bytes in jobs:
+        if expected_bytes is None:
+            plan.admitted.append(key)
+            plan.unknown_size.append(key)
+        elif expected_bytes > capacity:
+            plan.rejected.append(key)
+        elif expected_bytes <= budget:
+            plan.admitted.append(key)
+            plan.admitted_bytes += expected_bytes
+            budget -= expected_bytes
+        else:
+            plan.deferred.append(key)
+    return plan
+
+
+class ThroughputMeter:
+    """
+    Vazão medida por host (média móvel exponencial em bytes/s), compartilhada entre sessões e threads.
+    Alimentada pelo DownloadEngine ao fim de cada download; usada para estimar a duração dos próximos.
+    """
+
+    def __init__(self, smoothing=0.3):
+        self.smoothing = smoothing
+        self._lock = threading.Lock()
+        self._rates = {}
+
+    def record(self, host, nbytes, seconds):
+        if not nbytes or seconds <= 0:
+            return
+        rate = nbytes / seconds
+        with self._lock:
+            previous = self._rates.get(host)
+            self._rates[host] = rate if previous is None else previous + self.smoothing * (rate - previous)
+
+    def rate(self, host):
+        """Vazão estimada para o host: a medida, senão a média dos hosts medidos, senão DEFAULT_THROUGHPUT."""
+        with self._lock:
+            if host in self._rates:
+                return self._rates[host]
+            if self._rates:
+                return sum(self._rates.values()) / len(self._rates)
+        return DEFAULT_THROUGHPUT
+
+    def rates(self):
+        with self._lock:
+            return dict(self._rates)
+
+
+def estimate_seconds(job, meter, fallback_bytes=None):
+    """Duração estimada do job; sem tamanho conhecido, usa `fallback_bytes` (ex.: a mediana do lote) ou None."""
+    nbytes = job.expected_bytes if job.expected_bytes is not None else fallback_bytes
+    if nbytes is None:
+        return None
+    return nbytes / meter.rate(job.host)
+
+
+def _median_bytes(jobs):
+    sizes = sorted(job.expected_bytes for job in jobs if job.expected_bytes is not None)
+    return sizes[len(sizes) // 2] if sizes else None
+
+
+def schedule_batch(jobs, mode, meter):
+    """
+    Ordena os ScheduledJob do lote para despacho:
+    'sjf' pela duração estimada (tamanho ÷ vazão do host; tamanho desconhecido vai para o fim),
+    'fifo' na ordem recebida e 'priority' pela prioridade (maior primeiro, SJF como desempate).
+    """
+    if mode == 'fifo':
+        return list(jobs)
+
+    def duration_key(job):
+        seconds = estimate_seconds(job, meter)
+        return (seconds is None, seconds or 0)
+
+    if mode == 'priority':
+        return sorted(jobs, key=lambda job: (-job.priority, duration_key(job)))
+    return sorted(jobs, key=duration_key)
+
+
+def estimate_batch_eta(pending, running, workers, meter):
+    """
+    Segundos até o fim do lote, simulando o despacho em `workers` downloads paralelos.
+    `pending` são os ScheduledJob ainda na fila (na ordem de despacho); `running` são pares
+    (ScheduledJob, segundos_decorridos) dos que já estão baixando.
+    """
+    fallback_bytes = _median_bytes([job for job, _ in running] + list(pending))
+    slots = []
+    for job, elapsed in running:
+        seconds = estimate_seconds(job, meter, fallback_bytes) or 0
+        slots.append(max(seconds - elapsed, 0))
+    slots.extend([0.0] * max(workers - len(slots), 0))
+    heapq.heapify(slots)
+    for job in pending:
+        heapq.heappush(slots, heapq.heappop(slots) + (estimate_seconds(job, meter, fallback_bytes) or 0))
+    return max(slots) if slots else 0.0
+
@@ -0,0 +1,101 @@
+import hashlib
+import os
+import threading
+
+READ_CHUNK_BYTES = 1024 * 1024
+
+
+class StreamingHasher:
+    """
+    SHA-256 de um arquivo calculado enquanto ele é baixado, sem uma leitura completa no final.
+
+    Quem grava em ordem passa os bytes em update(); quando quem grava é outro (yt-dlp, ou as conexões
+    paralelas do download por trechos), follow() lê só o trecho recém-gravado, ainda no cache de
+    páginas, à medida que a parte contígua do arquivo cresce. Também serve de progress hook do yt-dlp.
+    O hash só vale para o arquivo que foi acompanhado: hexdigest_for() confere se é o mesmo (inode)
+    e se nada foi acrescentado ou regravado depois (ex.: remux ou mescla pelo ffmpeg).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._digest = hashlib.sha256()
+        self._identity = None # (st_dev, st_ino) do arquivo acompanhado
+        self.position = 0 # Bytes já incluídos no hash
+
+    def __call__(self, status):
+        if status.get('status') == 'downloading':
+            self.follow_path(status.get('tmpfilename') or status.get('filename'), status.get('downloaded_bytes'))
+        elif status.get('status') == 'finished':
+            self.follow_path(status.get('filename'), status.get('total_bytes') or status.get('downloaded_bytes'))
+
+    def __deepcopy__(self, memo):
+        return self # Compartilhado entre as instâncias; YdlPool.lease copia as opções com deepcopy
+
+    def update(self, data):
+        """Acrescenta os próximos bytes do arquivo, na ordem em que são gravados."""
+        with self._lock:
+            self._digest.update(data)
+            self.position += len(data)
+
+    def bind(self, path):
+        """Associa o hash (feito por update()) ao arquivo em que os bytes foram gravados."""
+        with self._lock:
+            self._identity = _identity(os.stat(path))
+
+    def follow(self, fd, upto, wait=True):
+        """
+        Lê do descritor e inclui no hash os bytes de `position` até `upto` (já gravados por outros).
+        Sem `wait`, não espera se outra thread já estiver lendo: ela alcança o trecho.
+        """
+        if not self._lock.acquire(blocking=wait):
+            return
+        try:
+            identity = _identity(os.fstat(fd))
+            if self._identity not in (None, identity) or upto < self.position:
+                self._restart() # Outro arquivo no mesmo caminho, ou o download recomeçou: refaz do zero
+            self._identity = identity
+            while self.position < upto:
+                data = os.pread(fd, min(READ_CHUNK_BYTES, upto - self.position), self.position)
+                if not data:
+                    break
+                self._digest.update(data)
+                self.position += len(data)
+        finally:
+            self._lock.release()
+
+    def follow_path(self, path, upto):
+        if not path or not upto:
+            return
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            return # Renomeado entre o aviso de progresso e a leitura: o próximo aviso alcança
+        try:
+            self.follow(fd, upto)
+        finally:
+            os.close(fd)
+
+    def reset(self):
+        """Descarta o que foi incluído, para acompanhar outro download do zero (ex.: após uma tentativa que falhou)."""
+        with self._lock:
+            self._restart()
+            self._identity = None
+
+    def hexdigest_for(self, path):
+        """O SHA-256 do arquivo em `path`, se o hash cobre exatamente o conteúdo dele; senão None."""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        with self._lock:
+            if self._identity != _identity(stat) or self.position != stat.st_size:
+                return None
+            return self._digest.hexdigest()
+
+    def _restart(self):
+        self._digest = hashlib.sha256()
+        self.position = 0
+
+
+def _identity(stat):
+    return stat.st_dev, stat.st_ino
@@ -0,0 +1,80 @@
+import math
+import re
+from dataclasses import dataclass
+
+# Segundos, "mm:ss" ou "hh:mm:ss", com fração opcional ("1:30.5")
+_OFFSET_RE = re.compile(r'^(?:(?:(\d+):)?(\d+):)?(\d+(?:[.,]\d+)?)$')
+
+
+@dataclass(frozen=True)
+class Clip:
+    """
+    Trecho de um vídeo a baixar no lugar do vídeo inteiro, em segundos desde o início.
+    Sem `exact`, o corte é feito no keyframe anterior ao início, copiando os streams (sem recodificar);
+    com `exact`, as bordas são recodificadas para começar e terminar exatamente nos instantes pedidos.
+    """
+    start: float = 0.0
+    end: float = None # None = até o fim do vídeo
+    exact: bool = False
+
+    def length(self, total=None):
+        """Duração do trecho em segundos (limitada à do vídeo); None se vai até o fim de uma duração desconhecida."""
+        end = self.end if not total else min(self.end or total, total)
+        return None if end is None else max(end - self.start, 0.0)
+
+    def fraction(self, total):
+        """Fração do vídeo coberta pelo trecho (1.0 se a duração do vídeo é desconhecida)."""
+        if not total:
+            return 1.0
+        return min(self.length(total) / total, 1.0)
+
+    @property
+    def label(self):
+        """O trecho em nomes de arquivo e chaves do catálogo: '1m30s-3m00s', '45s-fim', '1m30s-3m00s-exato'."""
+        end = format_offset(self.end) if self.end is not None else 'fim'
+        return f"{format_offset(self.start)}-{end}" + ("-exato" if self.exact else "")
+
+    def ranges(self):
+        """O trecho no formato da opção `download_ranges` do yt-dlp (download_range_func)."""
+        return [(self.start, self.end if self.end is not None else math.inf)]
+
+
+def parse_offset(text):
+    """'90', '1:30', '1:02:03' ou '1:30.5' -> segundos; vazio -> None. ValueError se não for um instante válido."""
+    text = (text or '').strip()
+    if not text:
+        return None
+    match = _OFFSET_RE.match(text)
+    if not match:
+        raise ValueError(f"Instante inválido: '{text}' (use segundos, mm:ss ou hh:mm:ss)")
+    hours, minutes, seconds = match.groups()
+    return int(hours or 0) * 3600 + int(minutes or 0) * 60 + float(seconds.replace(',', '.'))
+
+
+def parse_clip(start_text, end_text, exact=False):
+    """Clip a partir dos campos de início e fim; None se os dois estiverem vazios (vídeo inteiro)."""
+    start, end = parse_offset(start_text), parse_offset(end_text)
+    if start is None and end is None:
+        return None
+    if end is not None and end <= (start or 0):
+        raise ValueError("O fim do trecho deve ser depois do início.")
+    return Clip(start or 0.0, end, exact)
+
+
+def format_offset(seconds):
+    """Segundos -> '1h02m03s', '2m03s' ou '45s' (com fração, se houver)."""
+    seconds = round(seconds, 1)
+    whole = int(seconds)
+    fraction = f"{seconds - whole:.1f}"[1:] if seconds != whole else ""
+    hours, rest = divmod(whole, 3600)
+    minutes, secs = divmod(rest, 60)
+    if hours:
+        return f"{hours}h{minutes:02d}m{secs:02d}{fraction}s"
+    if minutes:
+        return f"{minutes}m{secs:02d}{fraction}s"
+    return f"{secs}{fraction}s"
+
+
+def clip_video_key(video_key, clip):
+    """Chave do vídeo no catálogo para um trecho: cada trecho é um conteúdo diferente do vídeo inteiro."""
+    return video_key if clip is None else f"{video_key}#{clip.label}"
@@ -0,0 +1,64 @@
+import sqlite3
+import threading
+import time
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS archive (
+    video_key TEXT PRIMARY KEY,
+    source_url TEXT,
+    created_at REAL
+);
+"""
+
+QUERY_BATCH = 500 # Chaves por consulta em known(); abaixo do limite de parâmetros do SQLite
+
+
+class DownloadArchive:
+    """
+    Arquivo persistente (SQLite) dos vídeos já baixados, pelo ID canônico "extrator id" (o mesmo do
+    arquivo de downloads do yt-dlp). Ao contrário do DownloadCatalog, não depende do arquivo continuar
+    no disco: serve para que varreduras periódicas de um site paguem só pelos vídeos novos.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def __contains__(self, video_key):
+        if not video_key:
+            return False
+        with self._lock:
+            return self._db.execute("SELECT 1 FROM archive WHERE video_key = ?", (video_key,)).fetchone() is not None
+
+    def known(self, video_keys):
+        """Subconjunto de `video_keys` que já está no arquivo (chaves None são ignoradas)."""
+        video_keys = [key for key in set(video_keys) if key]
+        found = set()
+        with self._lock:
+            for start in range(0, len(video_keys), QUERY_BATCH):
+                batch = video_keys[start:start + QUERY_BATCH]
+                rows = self._db.execute(
+                    f"SELECT video_key FROM archive WHERE video_key IN ({', '.join('?' * len(batch))})", batch)
+                found.update(row[0] for row in rows)
+        return found
+
+    def add(self, video_key, source_url=None):
+        """Registra o vídeo como baixado (idempotente)."""
+        with self._lock:
+            self._db.execute(
+                "INSERT OR IGNORE INTO archive (video_key, source_url, created_at) VALUES (?, ?, ?)",
+                (video_key, source_url, time.time()))
+            self._db.commit()
+
+    def remove(self, video_key):
+        """Esquece o vídeo (ex.: o arquivo baixado estava corrompido), para que volte a ser baixado."""
+        with self._lock:
+            self._db.execute("DELETE FROM archive WHERE video_key = ?", (video_key,))
+            self._db.commit()
@@ -0,0 +1,276 @@
+import errno
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+HASH_CHUNK_BYTES = 1024 * 1024
+LINK_SUFFIX = ".link" # Hard link temporário, trocado atomicamente pelo arquivo duplicado
+# Erros de os.link() em que o hard link não é possível ali (outro sistema de arquivos, sem suporte, limite de links)
+LINK_UNSUPPORTED_ERRNOS = {errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP, errno.EOPNOTSUPP}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    video_key TEXT NOT NULL,
+    format_id TEXT NOT NULL,
+    audio_format_id TEXT NOT NULL DEFAULT '',
+    path TEXT NOT NULL UNIQUE,
+    size INTEGER,
+    sha256 TEXT,
+    created_at REAL
+);
+CREATE INDEX IF NOT EXISTS files_item ON files (video_key, format_id, audio_format_id);
+CREATE INDEX IF NOT EXISTS files_hash ON files (sha256, size);
+"""
+
+# Metadados exibidos no navegador do catálogo (o `info` de record())
+INFO_COLUMNS = {
+    'source_url': 'TEXT',
+    'title': 'TEXT',
+    'format': 'TEXT', # Texto de exibição da qualidade (FormatOption.display)
+    'duration': 'REAL',
+}
+
+# Colunas acrescentadas a catálogos criados antes delas
+_ADDED_COLUMNS = {
+    **INFO_COLUMNS,
+    'updated_at': 'REAL',
+    'last_served_at': 'REAL', # Último acesso (salvar ou reproduzir), para a retenção por LRU
+}
+
+# Índice de texto completo dos títulos, mantido em sincronia com `files` por gatilhos
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS files_fts USING fts5(title, content='files', content_rowid='id');
+CREATE TRIGGER IF NOT EXISTS files_ai AFTER INSERT ON files BEGIN
+    INSERT INTO files_fts (rowid, title) VALUES (new.id, new.title);
+END;
+CREATE TRIGGER IF NOT EXISTS files_ad AFTER DELETE ON files BEGIN
+    INSERT INTO files_fts (files_fts, rowid, title) VALUES ('delete', old.id, old.title);
+END;
+CREATE TRIGGER IF NOT EXISTS files_au AFTER UPDATE OF title ON files BEGIN
+    INSERT INTO files_fts (files_fts, rowid, title) VALUES ('delete', old.id, old.title);
+    INSERT INTO files_fts (rowid, title) VALUES (new.id, new.title);
+END;
+CREATE INDEX IF NOT EXISTS files_created ON files (created_at);
+"""
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def file_sha256(path):
+    """SHA-256 do arquivo, lido em blocos."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fp:
+        while chunk := fp.read(HASH_CHUNK_BYTES):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DownloadCatalog:
+    """
+    Catálogo persistente (SQLite) dos arquivos baixados, endereçado pelo conteúdo:
+    cada arquivo é indexado pela chave do item (ID canônico do vídeo + format_id + áudio) e pelo hash.
+
+    Um novo pedido do mesmo item é resolvido com o arquivo que já existe (hard link no caminho pedido,
+    ou o próprio caminho existente quando não é possível criar o link), e arquivos de conteúdo idêntico
+    baixados por outras chaves viram hard links do primeiro, sem ocupar espaço de novo.
+
+    Guarda também os metadados de cada arquivo (INFO_COLUMNS) com índice de texto completo nos títulos,
+    para que o catálogo seja pesquisado e paginado sem varrer o diretório de downloads.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+        self._migrate()
+
+    def _migrate(self):
+        """Acrescenta as colunas de metadados e o índice de títulos a catálogos antigos."""
+        existing = {row['name'] for row in self._db.execute("PRAGMA table_info(files)")}
+        for column, column_type in _ADDED_COLUMNS.items():
+            if column not in existing:
+                self._db.execute(f"ALTER TABLE files ADD COLUMN {column} {column_type}")
+        has_fts = self._db.execute("SELECT 1 FROM sqlite_master WHERE name = 'files_fts'").fetchone()
+        self._db.executescript(_FTS_SCHEMA)
+        if not has_fts:
+            self._db.execute("INSERT INTO files_fts (files_fts) VALUES ('rebuild')")
+        self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def lookup(self, key):
+        """Caminho de um arquivo existente e íntegro (mesmo tamanho) para a chave, ou None. Remove registros obsoletos."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT id, path, size FROM files WHERE video_key = ? AND format_id = ? AND audio_format_id = ? ORDER BY id",
+                _item(key)).fetchall()
+            for row_id, path, size in rows:
+                if os.path.isfile(path) and os.path.getsize(path) == size:
+                    return path
+                self._db.execute("DELETE FROM files WHERE id = ?", (row_id,))
+            self._db.commit()
+        return None
+
+    def resolve(self, key, output_filepath, info=None):
+        """
+        Materializa o item já baixado em `output_filepath` sem transferir nada: retorna o caminho a usar
+        (o pedido, via hard link, ou o existente, como referência) ou None se o item não está no catálogo.
+        `info` são os metadados (INFO_COLUMNS) do novo caminho.
+        O arquivo encontrado pode ser removido (ex.: pela retenção) antes do link: aí procura o próximo.
+        """
+        while (existing := self.lookup(key)) is not None:
+            if os.path.abspath(existing) == os.path.abspath(output_filepath):
+                return output_filepath
+            if os.path.exists(output_filepath):
+                os.remove(output_filepath) # Arquivo de outro conteúdo no caminho pedido: o catálogo prevalece
+            try:
+                os.link(existing, output_filepath)
+            except OSError as e:
+                if os.path.isfile(existing) and e.errno in LINK_UNSUPPORTED_ERRNOS:
+                    return existing # Sem hard link possível: usa o existente
+                if os.path.isfile(existing):
+                    raise # O problema é o caminho pedido, não o arquivo do catálogo
+                continue # Removido entre a consulta e o link: lookup() esquece o registro
+            self.record(key, output_filepath, sha256=self.sha256_of(existing), info=info)
+            return output_filepath
+        return None
+
+    def record(self, key, path, sha256=None, info=None):
+        """
+        Registra um arquivo completo, com os metadados `info` (INFO_COLUMNS). Se já houver outro arquivo
+        com o mesmo conteúdo, este passa a ser um hard link dele (o espaço é liberado). Retorna o hash.
+        """
+        size = os.path.getsize(path)
+        sha256 = sha256 or file_sha256(path)
+        info = {column: (info or {}).get(column) for column in INFO_COLUMNS}
+        now = time.time()
+        with self._lock:
+            twin = self._db.execute(
+                "SELECT path FROM files WHERE sha256 = ? AND size = ? AND path != ?",
+                (sha256, size, os.path.abspath(path))).fetchone()
+            self._db.execute(
+                "INSERT INTO files (video_key, format_id, audio_format_id, path, size, sha256, created_at, updated_at, "
+                "source_url, title, format, duration) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (path) DO UPDATE SET video_key = excluded.video_key, format_id = excluded.format_id, "
+                "audio_format_id = excluded.audio_format_id, size = excluded.size, sha256 = excluded.sha256, "
+                "updated_at = excluded.updated_at, source_url = excluded.source_url, title = excluded.title, "
+                "format = excluded.format, duration = excluded.duration",
+                (*_item(key), os.path.abspath(path), size, sha256, now, now, *info.values()))
+            self._db.commit()
+        if twin and os.path.isfile(twin[0]) and not os.path.samefile(twin[0], path):
+            _replace_with_link(twin[0], path)
+        return sha256
+
+    def search(self, query=None, limit=50, offset=0):
+        """
+        Uma página do catálogo: com `query`, busca nos títulos pelo índice de texto completo (prefixos de
+        cada palavra, ordem por relevância); sem, os mais recentes primeiro. Retorna (linhas, total).
+        """
+        match = _match_expression(query)
+        total = self.count(query)
+        with self._lock:
+            if match is None:
+                rows = self._db.execute(
+                    "SELECT * FROM files ORDER BY created_at DESC LIMIT ? OFFSET ?", (limit, offset)).fetchall()
+            else:
+                rows = self._db.execute(
+                    "SELECT files.* FROM files_fts JOIN files ON files.id = files_fts.rowid "
+                    "WHERE files_fts MATCH ? ORDER BY files_fts.rank LIMIT ? OFFSET ?", (match, limit, offset)).fetchall()
+        return [dict(row) for row in rows], total
+
+    def count(self, query=None):
+        """Quantos arquivos do catálogo correspondem à busca (todos, sem `query`)."""
+        match = _match_expression(query)
+        with self._lock:
+            if match is None:
+                return self._db.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+            return self._db.execute("SELECT COUNT(*) FROM files_fts WHERE files_fts MATCH ?", (match,)).fetchone()[0]
+
+    def touch(self, path):
+        """Marca o arquivo como acessado agora (salvo ou reproduzido)."""
+        with self._lock:
+            self._db.execute("UPDATE files SET last_served_at = ? WHERE path = ?", (time.time(), os.path.abspath(path)))
+            self._db.commit()
+
+    def stored_bytes(self):
+        """Espaço ocupado pelos arquivos do catálogo, contando uma vez cada conteúdo (hard links não somam)."""
+        with self._lock:
+            return self._db.execute("SELECT COALESCE(SUM(size), 0) FROM (SELECT DISTINCT sha256, size FROM files)").fetchone()[0]
+
+    def least_recently_used(self, limit, used_before=None):
+        """
+        Conteúdos do catálogo do menos para o mais recentemente usado (baixado ou acessado, o mais recente
+        entre os seus hard links), opcionalmente só os sem uso desde `used_before`.
+        Retorna dicts com sha256, size, last_used e paths (todos os caminhos com esse conteúdo).
+        """
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT sha256, size, MAX(COALESCE(last_served_at, created_at)) AS last_used, json_group_array(path) AS paths "
+                "FROM files GROUP BY sha256, size HAVING last_used < ? ORDER BY last_used LIMIT ?",
+                (float('inf') if used_before is None else used_before, limit)).fetchall()
+        return [{**dict(row), 'paths': json.loads(row['paths'])} for row in rows]
+
+    def forget(self, paths):
+        """Remove os caminhos do catálogo (o arquivo em si é responsabilidade de quem chama)."""
+        with self._lock:
+            self._db.executemany("DELETE FROM files WHERE path = ?", [(os.path.abspath(path),) for path in paths])
+            self._db.commit()
+
+    def forget_content(self, path):
+        """
+        Remove do catálogo o caminho e todos os outros com o mesmo conteúdo (hash e tamanho), para que nenhum
+        pedido seja resolvido com ele de novo (ex.: reprovado na verificação). Retorna os caminhos esquecidos.
+        """
+        path = os.path.abspath(path)
+        with self._lock:
+            row = self._db.execute("SELECT sha256, size FROM files WHERE path = ?", (path,)).fetchone()
+            if row is None or row['sha256'] is None:
+                paths = [path]
+                self._db.execute("DELETE FROM files WHERE path = ?", (path,))
+            else:
+                paths = [twin[0] for twin in self._db.execute(
+                    "SELECT path FROM files WHERE sha256 = ? AND size = ?", (row['sha256'], row['size']))]
+                self._db.execute("DELETE FROM files WHERE sha256 = ? AND size = ?", (row['sha256'], row['size']))
+            self._db.commit()
+        return paths
+
+    def sha256_of(self, path):
+        """SHA-256 registrado para o arquivo, ou None se ele não está no catálogo."""
+        with self._lock:
+            row = self._db.execute("SELECT sha256 FROM files WHERE path = ?", (os.path.abspath(path),)).fetchone()
+        return row[0] if row else None
+
+
+def _match_expression(query):
+    """Converte o texto digitado numa expressão FTS5 segura: cada palavra vira um prefixo entre aspas."""
+    tokens = _TOKEN_RE.findall(query or '')
+    if not tokens:
+        return None
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def _item(key):
+    video_key, format_id, audio_format_id = key
+    return video_key, format_id, audio_format_id or ''
+
+
+def _replace_with_link(source, path):
+    """Troca `path` por um hard link de `source` (conteúdo idêntico), atomicamente; mantém o arquivo se não der."""
+    tmp_path = f"{path}{LINK_SUFFIX}"
+    try:
+        os.link(source, tmp_path)
+        os.replace(tmp_path, path)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
@@ -0,0 +1,617 @@
+import concurrent.futures
+import contextlib
+import copy
+import os
+import shutil
+import subprocess
+import threading
+import time
+from dataclasses import dataclass, replace
+from urllib.parse import urlparse
+
+import requests
+import yt_dlp
+
+from checksum import StreamingHasher
+from executors import ResizableExecutor, create_thread_pool
+from integrity import CorruptDownloadError
+from segmented_download import (
+    FRAGMENT_PROTOCOLS, RANGE_PROTOCOLS, MIN_SPLIT_BYTES, ConcurrencyTuner, UnsupportedStream,
+    build_session, download_fragments, download_ranges, fragment_list, probe_range_size,
+)
+from staging import commit_staged, discard_staged, staging_path
+
+POSTPROCESS_WORKERS = max(1, (os.cpu_count() or 2) // 2) # Mesclagens/remux pelo ffmpeg ao mesmo tempo
+STREAMS_PER_DOWNLOAD = 4 # Streams simultâneos por vaga de download: vídeo + áudio de um par, com folga para várias qualidades
+MERGE_SPACE_FACTOR = 2 # Vídeo + áudio: os streams baixados e o arquivo mesclado ficam no disco ao mesmo tempo
+
+
+@dataclass(frozen=True)
+class DownloadJob:
+    """Um pedido de download: vídeo, formato escolhido e caminho final do arquivo."""
+    video_url: str
+    format_id: str
+    output_filepath: str
+    audio_format_id: str = None # Áudio a mesclar quando o formato escolhido é apenas vídeo
+    expected_bytes: int = None # Tamanho esperado do arquivo final (o SpaceLedger reserva peak_bytes)
+    bandwidth_weight: float = 1.0 # Peso na divisão da banda entre downloads simultâneos
+    catalog_key: tuple = None # (ID canônico do vídeo, format_id, audio_format_id) no DownloadCatalog
+    catalog_info: dict = None # Metadados do arquivo no catálogo (source_url, title, format, duration)
+    expected_duration: float = None # Duração do info_dict, conferida na verificação de integridade
+    expected_streams: tuple = () # Streams que o arquivo deve ter ('video', 'audio')
+    clip: object = None # Clip (clips.py): baixa só esse trecho do vídeo
+    archive_key: str = None # Chave do vídeo no DownloadArchive (archive_id_for_url); None = não registrar
+
+    @property
+    def peak_bytes(self):
+        """Espaço máximo ocupado pelo download: ao mesclar vídeo e áudio, os streams e o resultado coexistem no disco."""
+        if self.expected_bytes is None or not self.audio_format_id or self.clip is not None:
+            return self.expected_bytes
+        return self.expected_bytes * MERGE_SPACE_FACTOR
+
+
+@dataclass(frozen=True)
+class MultiRenditionJob:
+    """Várias qualidades do mesmo vídeo: uma DownloadJob por saída, todas com o mesmo video_url."""
+    video_url: str
+    renditions: tuple
+
+    @property
+    def expected_bytes(self):
+        sizes = [rendition.expected_bytes for rendition in self.renditions]
+        return None if None in sizes else sum(sizes)
+
+    @property
+    def peak_bytes(self):
+        sizes = [rendition.peak_bytes for rendition in self.renditions]
+        return None if None in sizes else sum(sizes)
+
+    @property
+    def bandwidth_weight(self):
+        return max(rendition.bandwidth_weight for rendition in self.renditions)
+
+    @property
+    def output_filepaths(self):
+        return [rendition.output_filepath for rendition in self.renditions]
+
+
+def output_paths(job):
+    return job.output_filepaths if isinstance(job, MultiRenditionJob) else [job.output_filepath]
+
+
+def staged_job(job):
+    """A mesma job gravando nos caminhos temporários (staging) em vez dos finais."""
+    if isinstance(job, MultiRenditionJob):
+        return replace(job, renditions=tuple(staged_job(rendition) for rendition in job.renditions))
+    return replace(job, output_filepath=staging_path(job.output_filepath))
+
+
+class DownloadEngine:
+    """
+    Executa os downloads em threads persistentes, reaproveitando as instâncias YoutubeDL do YdlPool.
+
+    Vídeo e áudio pareados são baixados em paralelo e mesclados pelo ffmpeg sem recodificar; a mescla
+    roda num pool próprio, depois de liberar a vaga de download. Cada saída é gravada num arquivo
+    temporário e só publicada (fsync + rename atômico) depois de completa.
+    Os colaboradores opcionais (catálogo, diário, verificação, espaço, banda) são descritos no __init__.
+    """
+
+    def __init__(self, ydl_pool, max_workers=1, streams_per_download=STREAMS_PER_DOWNLOAD, postprocess_workers=POSTPROCESS_WORKERS, space_ledger=None, throughput_meter=None, bandwidth_shaper=None, catalog=None, archive=None, journal=None, verifier=None):
+        self.ydl_pool = ydl_pool
+        self.verifier = verifier # Verifica cada arquivo concluído no pool de processos; corrompido, o job volta para a fila
+        self.catalog = catalog # Resolve itens já baixados com o arquivo existente e guarda o SHA-256 de cada saída
+        self.archive = archive # Registra cada vídeo concluído no arquivo de downloads
+        self.journal = journal # Início, falha e conclusão de cada saída no diário de jobs
+        self.space_ledger = space_ledger # Cada download reserva o pico de espaço que ocupa (peak_bytes) enquanto roda
+        self.throughput_meter = throughput_meter # Vazão de cada download concluído, por host
+        self.bandwidth_shaper = bandwidth_shaper # Todos os streams de um download dividem a banda sob os limites dele
+        self._checksums = {} # caminho gravado -> SHA-256 calculado durante o download (consumido pelo catálogo)
+        self._checksums_lock = threading.Lock()
+        self.fragment_tuner = ConcurrencyTuner() # Fragmentos HLS/DASH simultâneos, por host, a partir da vazão observada
+        self.connection_tuner = ConcurrencyTuner() # Conexões por download progressivo grande (baixado em trechos)
+        self._network_stage = threading.local() # _NetworkStage do job que a thread executa (current) e o aviso on_transfer_start dele (on_start)
+        # Uma vaga por transferência; as threads a mais esperam o pós-processamento sem ocupar vaga
+        self._download_slots = _Slots(max_workers)
+        self._executor = ResizableExecutor(create_thread_pool("download"), max_workers + postprocess_workers)
+        self._streams_per_download = streams_per_download
+        # Vídeo e áudio de um par (e as qualidades de um MultiRenditionJob): acompanha o número de vagas
+        self._stream_executor = ResizableExecutor(create_thread_pool("stream"), max_workers * streams_per_download)
+        self._postprocess_executor = ResizableExecutor(create_thread_pool("postprocess"), postprocess_workers) # Mescla e remux pelo ffmpeg
+
+    @property
+    def max_workers(self):
+        return self._download_slots.limit
+
+    @property
+    def postprocess_workers(self):
+        return self._postprocess_executor.max_workers
+
+    def resize(self, max_workers=None, postprocess_workers=None):
+        """Muda os downloads e as mesclagens simultâneos sem interromper os jobs em andamento (None = mantém)."""
+        max_workers = max_workers or self.max_workers
+        postprocess_workers = postprocess_workers or self.postprocess_workers
+        self._download_slots.resize(max_workers)
+        self._stream_executor.resize(max_workers * self._streams_per_download)
+        self._postprocess_executor.resize(postprocess_workers)
+        self._executor.resize(max_workers + postprocess_workers)
+
+    def submit(self, job, on_transfer_start=None):
+        """
+        Agenda o download (DownloadJob ou MultiRenditionJob) e retorna o Future correspondente.
+        `on_transfer_start` (sem argumentos) é chamado, na thread do download, quando o job ganha uma vaga.
+        """
+        run = self._run_multi if isinstance(job, MultiRenditionJob) else self._run
+        if self.verifier is None:
+            return self._executor.submit(self._run_archived, run, job, on_transfer_start)
+        result = concurrent.futures.Future()
+        self._submit_verified(run, job, result, 0, on_transfer_start)
+        return result
+
+    def download(self, job):
+        """
+        Baixa e bloqueia até terminar (propaga os erros do yt-dlp). Retorna o caminho do arquivo (ou a lista,
+        para MultiRenditionJob), que pode ser um arquivo já existente no catálogo.
+        """
+        return self.submit(job).result()
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._stream_executor.shutdown(wait=False, cancel_futures=True)
+        self._postprocess_executor.shutdown(wait=False, cancel_futures=True)
+
+    def _submit_verified(self, run, job, result, attempt, on_transfer_start=None):
+        """Uma tentativa de download cujo término agenda a verificação; `result` só termina após ela."""
+        def start():
+            if not result.running():
+                result.set_running_or_notify_cancel()
+            return self._run_archived(run, job, on_transfer_start)
+        download = self._executor.submit(start)
+        download.add_done_callback(lambda future: self._verify(future, run, job, result, attempt, on_transfer_start))
+
+    def _verify(self, download, run, job, result, attempt, on_transfer_start=None):
+        if download.cancelled():
+            if not result.cancel():
+                result.set_exception(concurrent.futures.CancelledError())
+            return
+        if download.exception() is not None:
+            result.set_exception(download.exception())
+            return
+        renditions = job.renditions if isinstance(job, MultiRenditionJob) else (job,)
+        paths = download.result() if isinstance(job, MultiRenditionJob) else [download.result()]
+        try:
+            checks = [
+                self.verifier.check(path, rendition.expected_duration, rendition.expected_streams)
+                for rendition, path in zip(renditions, paths)
+            ]
+        except RuntimeError: # Pool de processos encerrado ou quebrado: entrega sem verificar
+            result.set_result(download.result())
+            return
+        pending = [len(checks)]
+        lock = threading.Lock()
+
+        def checked(_):
+            with lock:
+                pending[0] -= 1
+                if pending[0]:
+                    return
+            self._after_verify(checks, run, job, renditions, paths, download.result(), result, attempt, on_transfer_start)
+
+        for check in checks:
+            check.add_done_callback(checked)
+
+    def _after_verify(self, checks, run, job, renditions, paths, value, result, attempt, on_transfer_start=None):
+        """Aprova o download, ou descarta os arquivos reprovados e baixa de novo (até `max_requeues` vezes)."""
+        problems = []
+        for rendition, path, check in zip(renditions, paths, checks):
+            report = check.result() if check.exception() is None else None
+            if report is None or report.ok:
+                continue # O probe em si falhou (pool encerrado...): não reprova o arquivo por isso
+            problems.append(f"{os.path.basename(path)}: {', '.join(report.problems)}")
+            self._discard_corrupt(rendition, path, report)
+        if not problems:
+            result.set_result(value)
+        elif attempt < self.verifier.max_requeues:
+            self._submit_verified(run, job, result, attempt + 1, on_transfer_start)
+        else:
+            result.set_exception(CorruptDownloadError("; ".join(problems)))
+
+    def _discard_corrupt(self, rendition, path, report):
+        """
+        Tira o arquivo reprovado do disco (só se for a saída deste job: um caminho resolvido pelo catálogo
+        pode ser de outro download), do catálogo, com todas as cópias do mesmo conteúdo, e do arquivo de downloads.
+        """
+        if os.path.abspath(path) == os.path.abspath(rendition.output_filepath) and os.path.exists(path):
+            os.remove(path)
+        if self.catalog is not None:
+            self.catalog.forget_content(path)
+        if self.archive is not None and rendition.archive_key:
+            self.archive.remove(rendition.archive_key)
+        if self.journal is not None:
+            self.journal.fail(rendition.output_filepath, "; ".join(report.problems))
+
+    def _run_archived(self, run, job, on_transfer_start=None):
+        """Executa o download e, concluído, registra o vídeo no arquivo de downloads."""
+        self._network_stage.on_start = on_transfer_start # Lido pelo _NetworkStage desta thread
+        try:
+            result = self._run_cataloged(run, job)
+        finally:
+            self._network_stage.on_start = None
+        if self.archive is not None:
+            rendition = job.renditions[0] if isinstance(job, MultiRenditionJob) else job
+            if rendition.archive_key:
+                self.archive.add(rendition.archive_key, job.video_url)
+        return result
+
+    def _run_cataloged(self, run, job):
+        """Resolve pelo catálogo as saídas já baixadas, baixa só as que faltam e registra as novas."""
+        if self.catalog is None:
+            return self._run_reserved(run, job)
+        renditions = job.renditions if isinstance(job, MultiRenditionJob) else (job,)
+        paths = [self._resolve(rendition) for rendition in renditions]
+        missing = tuple(rendition for rendition, path in zip(renditions, paths) if path is None)
+        if missing:
+            self._run_reserved(run, replace(job, renditions=missing) if isinstance(job, MultiRenditionJob) else job)
+            for rendition in missing:
+                # Saídas mescladas (vídeo + áudio), remuxadas ou corrigidas pelo yt-dlp não têm o hash do download:
+                # o muxer mp4 do ffmpeg reescreve o tamanho do 'mdat' no fim, então os bytes gravados durante a
+                # mescla não são os finais. Para elas, record() lê o arquivo uma vez, já fora da vaga de download.
+                checksum = self._pop_checksum(rendition.output_filepath)
+                if rendition.catalog_key:
+                    self.catalog.record(rendition.catalog_key, rendition.output_filepath, sha256=checksum, info=rendition.catalog_info)
+        paths = [path or rendition.output_filepath for rendition, path in zip(renditions, paths)]
+        return paths if isinstance(job, MultiRenditionJob) else paths[0]
+
+    def _resolve(self, job):
+        if not job.catalog_key:
+            return None
+        return self.catalog.resolve(job.catalog_key, job.output_filepath, info=job.catalog_info)
+
+    def _run_reserved(self, run, job):
+        """Executa o download com o espaço de pico reservado (InsufficientSpaceError se não couber)."""
+        if self.space_ledger is None:
+            return self._run_measured(run, job)
+        with self.space_ledger.reservation(object(), job.peak_bytes):
+            return self._run_measured(run, job)
+
+    def _run_measured(self, run, job):
+        """
+        Executa o download numa vaga de download, sob o controle de banda, e registra bytes gravados / tempo
+        na vazão do host. A vaga e a banda são devolvidas ao fim da transferência (ver _postprocess).
+        """
+        with _NetworkStage(self, job) as stage:
+            self._network_stage.current = stage
+            try:
+                return self._run_staged(run, job, stage.flow)
+            finally:
+                self._network_stage.current = None
+
+    def _end_network_stage(self, written=None):
+        """Fim da transferência do job desta thread (se houver): libera a vaga de download e a banda."""
+        stage = getattr(self._network_stage, 'current', None)
+        if stage is not None:
+            stage.end(written)
+
+    def _postprocess(self, function, *args):
+        """Roda um passo do ffmpeg no pool de pós-processamento e espera o resultado, fora da vaga de download."""
+        self._end_network_stage()
+        return self._postprocess_executor.submit(function, *args).result()
+
+    def _run_staged(self, run, job, flow=None):
+        """Executa o download nos caminhos temporários e publica cada saída no caminho final ao terminar."""
+        staged = staged_job(job)
+        final_paths = output_paths(job)
+        staged_paths = output_paths(staged)
+        if self.journal is not None:
+            for final_path in final_paths:
+                self.journal.start(final_path, job.video_url)
+        try:
+            run(staged, flow)
+        except BaseException as e:
+            for staged_path, final_path in zip(staged_paths, final_paths):
+                discard_staged(staged_path)
+                self._pop_checksum(staged_path)
+                if self.journal is not None:
+                    self.journal.fail(final_path, str(e))
+            raise
+        for staged_path, final_path in zip(staged_paths, final_paths):
+            commit_staged(staged_path, final_path)
+            checksum = self._pop_checksum(staged_path)
+            if checksum is not None:
+                self._remember_checksum(final_path, checksum) # O rename mantém o conteúdo (e o inode)
+            if self.journal is not None:
+                self.journal.finish(final_path)
+        return final_paths if isinstance(job, MultiRenditionJob) else job.output_filepath
+
+    def _run(self, job, flow=None):
+        if job.clip is not None:
+            # Um único ffmpeg busca o trecho de vídeo e áudio juntos (as bordas ficam alinhadas) e grava a saída
+            format_spec = f"{job.format_id}+{job.audio_format_id}" if job.audio_format_id else job.format_id
+            self._fetch(job.video_url, format_spec, job.output_filepath, "download", flow=flow, clip=job.clip)
+        elif job.audio_format_id and shutil.which('ffmpeg'):
+            self._download_pair(job, flow)
+        elif job.audio_format_id:
+            # Sem ffmpeg próprio para mesclar: deixa o yt-dlp tentar com a especificação "vídeo+áudio"
+            self._fetch(job.video_url, f"{job.format_id}+{job.audio_format_id}", job.output_filepath, "download", flow=flow)
+        else:
+            self._fetch(job.video_url, job.format_id, job.output_filepath, "download", flow=flow)
+        return job.output_filepath
+
+    def _download_pair(self, job, flow=None):
+        """Baixa vídeo e áudio ao mesmo tempo e mescla os dois no arquivo final."""
+        self._run_multi(MultiRenditionJob(job.video_url, (job,)), flow)
+
+    def _run_multi(self, job, flow=None):
+        """
+        Baixa várias saídas do mesmo vídeo com uma única extração: cada áudio distinto é baixado
+        uma só vez, os streams de vídeo em paralelo, e cada saída é mesclada localmente.
+        """
+        if not shutil.which('ffmpeg') or job.renditions[0].clip is not None:
+            return [self._run(rendition, flow) for rendition in job.renditions]
+
+        info = self._extract(job.video_url)
+        base, _ = os.path.splitext(job.renditions[0].output_filepath)
+        stream_futures = {}
+
+        def fetch_stream(format_id):
+            if format_id not in stream_futures:
+                stream_futures[format_id] = self._stream_executor.submit(
+                    self._fetch, job.video_url, format_id, f"{base}.f{format_id}.%(ext)s", "stream", info, flow)
+            return stream_futures[format_id]
+
+        output_futures = []
+        for rendition in job.renditions:
+            if rendition.audio_format_id:
+                output_futures.append((rendition, fetch_stream(rendition.format_id), fetch_stream(rendition.audio_format_id)))
+            else:
+                output_futures.append((rendition, self._stream_executor.submit(
+                    self._fetch, job.video_url, rendition.format_id, rendition.output_filepath, "download", info, flow), None))
+        try:
+            merges = []
+            for rendition, video_future, audio_future in output_futures:
+                if audio_future is not None:
+                    merges.append((video_future.result(), audio_future.result(), rendition.output_filepath))
+                else:
+                    video_future.result()
+            # Tudo transferido: a vaga de download passa adiante e as mesclagens rodam no pool de pós-processamento
+            transferred = {path for merge in merges for path in merge[:2]} | set(output_paths(job))
+            written = sum(os.path.getsize(path) for path in transferred if os.path.exists(path))
+            self._end_network_stage(written)
+            mixing = [self._postprocess_executor.submit(merge_streams, *merge) for merge in merges]
+            for future in mixing:
+                future.result()
+        finally:
+            concurrent.futures.wait(stream_futures.values())
+            for future in stream_futures.values():
+                path = None if future.exception() else future.result()
+                if path:
+                    self._pop_checksum(path)
+                if path and os.path.exists(path):
+                    os.remove(path)
+        return [rendition.output_filepath for rendition in job.renditions]
+
+    def _extract(self, video_url):
+        """
+        Extrai as informações uma vez, para que vários streams do mesmo vídeo sejam baixados a partir delas.
+        Sem `process`, o resultado ainda não passou pela seleção de formato, então cada stream escolhe o seu.
+        """
+        with self.ydl_pool.lease("stream") as ydl:
+            return ydl.extract_info(video_url, download=False, process=False)
+
+    def _fetch(self, video_url, format_spec, outtmpl, profile, info=None, flow=None, clip=None):
+        """
+        Baixa `format_spec` com a instância YoutubeDL da thread atual e retorna o caminho gravado.
+        Com `info` (já extraído), pula a extração e baixa direto a partir dele.
+        Com `flow` (do BandwidthShaper), o progresso do download passa pelo controle de banda.
+        Com o catálogo, o SHA-256 do arquivo é calculado durante o download, exceto quando o arquivo é
+        regravado depois (mescla de vídeo + áudio, remux, fixup): ver _run_cataloged.
+        Com `clip`, baixa só o trecho (download_ranges do yt-dlp), sempre pelo yt-dlp/ffmpeg.
+        """
+        host = urlparse(video_url).netloc
+        hasher = StreamingHasher() if self.catalog is not None else None
+        overrides = {
+            'format': format_spec,
+            'outtmpl': outtmpl,
+            'concurrent_fragment_downloads': self.fragment_tuner.current(host), # Para o que ficar com o yt-dlp
+        }
+        if clip is not None:
+            overrides['download_ranges'] = yt_dlp.utils.download_range_func(None, clip.ranges())
+            overrides['force_keyframes_at_cuts'] = clip.exact
+        hooks = [hook for hook in (flow, hasher) if hook is not None]
+        if hooks:
+            overrides['progress_hooks'] = hooks
+        path = None
+        try:
+            with self.ydl_pool.lease(profile, **overrides) as ydl:
+                if info is None:
+                    info = ydl.extract_info(video_url, download=False, process=False)
+                info = copy.deepcopy(info)
+                if clip is None:
+                    # Resolve (url/url_transparent) e escolhe o formato uma vez só: o yt-dlp, se precisar, baixa deste resultado
+                    info = ydl.process_ie_result(info, download=False)
+                    path = self._fetch_native(ydl, info, host, flow, hasher)
+                if path is None:
+                    info = ydl.process_ie_result(info, download=True)
+        except yt_dlp.utils.DownloadError:
+            raise
+        except Exception:
+            self.ydl_pool.discard() # Erro inesperado: não reaproveitar uma instância em estado desconhecido
+            raise
+        if path is None:
+            downloads = (info or {}).get('requested_downloads') or [{}]
+            path = downloads[0].get('filepath') or outtmpl
+        if hasher is not None:
+            checksum = hasher.hexdigest_for(path) # None se o arquivo foi regravado depois (mescla, remux, fixup)
+            if checksum is not None:
+                self._remember_checksum(path, checksum)
+        return path
+
+    def _remember_checksum(self, path, checksum):
+        with self._checksums_lock:
+            self._checksums[os.path.abspath(path)] = checksum
+
+    def _pop_checksum(self, path):
+        with self._checksums_lock:
+            return self._checksums.pop(os.path.abspath(path), None)
+
+    def _fetch_native(self, ydl, selected, host, flow=None, hasher=None):
+        """
+        Baixa um formato único com os downloaders nativos e retorna o caminho gravado: HLS/DASH por
+        fragmentos simultâneos, progressivo grande por várias conexões com Range.
+        Retorna None se o formato não for elegível (combinação de formatos, ao vivo, criptografado,
+        servidor sem Range...) ou se o download nativo falhar, para que o yt-dlp baixe como de costume.
+        As requisições usam os cookies, o proxy e o endereço de origem da instância do yt-dlp.
+        """
+        if selected.get('_type', 'video') != 'video' or selected.get('requested_formats') or selected.get('is_live'):
+            return None
+        protocol = selected.get('protocol')
+        if protocol not in FRAGMENT_PROTOCOLS and (protocol not in RANGE_PROTOCOLS or selected.get('fragments')):
+            return None
+        session = build_session(
+            cookies=ydl.cookiejar, proxy=ydl.params.get('proxy'),
+            source_address=ydl.params.get('source_address'), verify=not ydl.params.get('nocheckcertificate'))
+        with session:
+            return self._fetch_native_with(session, ydl, selected, host, flow, hasher)
+
+    def _fetch_native_with(self, session, ydl, selected, host, flow=None, hasher=None):
+        """_fetch_native() com a Session já configurada."""
+        protocol = selected.get('protocol')
+        headers = selected.get('http_headers')
+        try:
+            if protocol in FRAGMENT_PROTOCOLS:
+                fragments = fragment_list(selected, session)
+            else:
+                size = probe_range_size(selected['url'], session, headers)
+                if not size or size < MIN_SPLIT_BYTES:
+                    return None
+        except (UnsupportedStream, requests.exceptions.RequestException):
+            return None
+
+        path = ydl.prepare_filename(selected)
+        progress = None
+        if flow is not None:
+            progress = lambda written: flow({'status': 'downloading', 'filename': path, 'downloaded_bytes': written})
+            progress(0)
+        tuner = self.fragment_tuner if protocol in FRAGMENT_PROTOCOLS else self.connection_tuner
+        concurrency = tuner.current(host)
+        started = time.monotonic()
+        try:
+            if protocol in FRAGMENT_PROTOCOLS:
+                expected = selected.get('filesize') or selected.get('filesize_approx')
+                written = download_fragments(fragments, path, concurrency, headers, progress, expected, hasher, session)
+                if hasher is not None:
+                    hasher.bind(path)
+            else:
+                written = download_ranges(selected['url'], path, size, concurrency, headers, progress, hasher, session)
+        except (UnsupportedStream, requests.exceptions.RequestException) as e:
+            # O arquivo parcial já foi apagado: o yt-dlp tenta de novo do zero, com os seus próprios retries
+            ydl.report_warning(f"Falha no download nativo, usando o yt-dlp: {e}")
+            if hasher is not None:
+                hasher.reset()
+            return None
+        tuner.record(host, concurrency, written, time.monotonic() - started)
+        if os.path.splitext(path)[1] in ('.mp4', '.m4a') and is_mpegts(path) and shutil.which('ffmpeg'):
+            self._postprocess(remux_to_mp4, path) # Segmentos .ts num arquivo mp4: corrige como o FixupM3u8 do yt-dlp
+        return path
+
+
+class _Slots:
+    """Vagas de download: um semáforo cujo limite pode mudar com vagas ocupadas (as excedentes saem ao serem liberadas)."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self._taken = 0
+        self._condition = threading.Condition()
+
+    def resize(self, limit):
+        with self._condition:
+            self.limit = limit
+            self._condition.notify_all()
+
+    def acquire(self):
+        with self._condition:
+            self._condition.wait_for(lambda: self._taken < self.limit)
+            self._taken += 1
+
+    def release(self):
+        with self._condition:
+            self._taken -= 1
+            self._condition.notify()
+
+
+class _NetworkStage:
+    """
+    A parte de rede de um job: ocupa uma vaga de download e a parcela do job na banda, do início da
+    transferência até end(), chamado antes do pós-processamento ou, se não houver, ao fim do job.
+    """
+
+    def __init__(self, engine, job):
+        self.engine = engine
+        self.job = job
+        self.host = urlparse(job.video_url).netloc
+        self.flow = None
+        self._resources = contextlib.ExitStack()
+        self._started = None
+        self._ended = False
+
+    def __enter__(self):
+        self.engine._download_slots.acquire()
+        self._resources.callback(self.engine._download_slots.release)
+        if self.engine.bandwidth_shaper is not None:
+            self.flow = self._resources.enter_context(self.engine.bandwidth_shaper.flow(self.host, self.job.bandwidth_weight))
+        self._started = time.monotonic()
+        on_start = getattr(self.engine._network_stage, 'on_start', None)
+        if on_start is not None:
+            on_start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.end()
+        elif not self._ended:
+            self._ended = True
+            self._resources.close()
+
+    def end(self, written=None):
+        """Devolve a vaga e a banda e registra a vazão (bytes gravados, ou `written`, pelo tempo de transferência)."""
+        if self._ended:
+            return
+        self._ended = True
+        elapsed = time.monotonic() - self._started
+        self._resources.close()
+        if self.engine.throughput_meter is not None:
+            if written is None:
+                paths = output_paths(self.job) + output_paths(staged_job(self.job))
+                written = sum(os.path.getsize(path) for path in paths if os.path.exists(path))
+            self.engine.throughput_meter.record(self.host, written, elapsed)
+
+
+def is_mpegts(path):
+    """Verifica o byte de sincronismo do MPEG-TS (0x47 a cada 188 bytes) no início do arquivo."""
+    with open(path, 'rb') as fp:
+        head = fp.read(377)
+    return len(head) == 377 and head[0] == head[188] == head[376] == 0x47
+
+
+def remux_to_mp4(path):
+    """Regrava o arquivo no container MP4 copiando os streams (sem recodificar)."""
+    base, ext = os.path.splitext(path)
+    tmp_path = f"{base}.remux{ext}"
+    result = subprocess.run(
+        ['ffmpeg', '-y', '-loglevel', 'error', '-i', path, '-map', '0', '-c', 'copy', '-f', 'mp4', tmp_path],
+        capture_output=True, text=True)
+    if result.returncode != 0:
+        raise yt_dlp.utils.DownloadError(f"Falha ao corrigir o container: {result.stderr.strip()}")
+    os.replace(tmp_path, path)
+
+
+def merge_streams(video_path, audio_path, output_filepath):
+    """Mescla um stream de vídeo e um de áudio no container final copiando os streams (sem recodificar)."""
+    command = [
+        'ffmpeg', '-y', '-loglevel', 'error',
+        '-i', video_path, '-i', audio_path,
+        '-map', '0:v:0', '-map', '1:a:0', '-c', 'copy',
+        output_filepath,
+    ]
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise yt_dlp.utils.DownloadError(f"Falha ao mesclar vídeo e áudio: {result.stderr.strip()}")
@@ -0,0 +1,69 @@
+import concurrent.futures
+import functools
+import importlib.util
+import multiprocessing
+import threading
+
+# Módulos com as funções executadas nos processos trabalhadores (extração e verificação de integridade)
+WORKER_MODULES = ['extraction', 'integrity']
+
+
+def worker_main_spec():
+    """
+    ModuleSpec deste módulo, a usar como __spec__ do script do Streamlit (o __main__ do servidor).
+    Processos iniciados com 'forkserver'/'spawn' recriam o __main__ do pai: pelo nome do spec, carregam
+    só este módulo, em vez de re-executar o script inteiro pelo caminho do arquivo.
+    """
+    return importlib.util.find_spec(__name__)
+
+
+def create_process_pool(max_workers):
+    """
+    Cria um pool de processos para as funções de WORKER_MODULES.
+
+    Usa 'forkserver' quando disponível: os processos saem de um servidor de fork iniciado do zero (sem as
+    threads do Streamlit, cujos locks um fork direto poderia copiar presos), que já importou só os módulos
+    trabalhadores. Sem ele (Windows), 'spawn'. Em ambos, o script precisa usar worker_main_spec().
+    """
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        mp_context = multiprocessing.get_context('forkserver')
+        mp_context.set_forkserver_preload(WORKER_MODULES)
+    else:
+        mp_context = multiprocessing.get_context('spawn')
+    return concurrent.futures.ProcessPoolExecutor(max_workers=max_workers, mp_context=mp_context)
+
+
+def create_thread_pool(thread_name_prefix):
+    """Fábrica de ThreadPoolExecutor (recebe max_workers) para o ResizableExecutor."""
+    return functools.partial(concurrent.futures.ThreadPoolExecutor, thread_name_prefix=thread_name_prefix)
+
+
+class ResizableExecutor:
+    """
+    Executor cujo número de workers pode mudar em uso: resize() troca o executor interno por um novo
+    criado por `factory(max_workers)`, e o anterior termina o que já recebeu antes de encerrar.
+    Assim um recurso compartilhado é redimensionado em vez de recriado (e abandonado) a cada valor.
+    """
+
+    def __init__(self, factory, max_workers):
+        self._factory = factory
+        self._lock = threading.Lock()
+        self.max_workers = max_workers
+        self._executor = factory(max_workers)
+
+    def resize(self, max_workers):
+        with self._lock:
+            if max_workers == self.max_workers:
+                return
+            previous, self._executor = self._executor, self._factory(max_workers)
+            self.max_workers = max_workers
+        previous.shutdown(wait=False)
+
+    def submit(self, fn, /, *args, **kwargs):
+        with self._lock:
+            return self._executor.submit(fn, *args, **kwargs)
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        with self._lock:
+            executor = self._executor
+        executor.shutdown(wait=wait, cancel_futures=cancel_futures)
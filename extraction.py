@@ -0,0 +1,274 @@
+import functools
+import re
+from dataclasses import dataclass
+
+import yt_dlp
+
+from size_estimation import fill_missing_sizes
+from ydl_pool import YdlPool
+
+_worker_pool = None # Pool de instâncias YoutubeDL do processo trabalhador
+
+
+class ExtractionError(Exception):
+    """Falha na extração de informações. Carrega só a mensagem, para atravessar processos sem problemas."""
+
+
+@dataclass(slots=True, frozen=True)
+class VideoRecord:
+    """
+    Registro compacto de um vídeo processado, guardado no st.session_state no lugar do info_dict completo.
+    Mantém só o que a interface e o downloader usam; `webpage_url` + `extractor_key` formam o
+    "handle" de download (permitem ao yt-dlp ir direto ao extrator certo).
+    """
+    video_id: str
+    title: str
+    duration: float
+    formats: "FormatTable" # Opções de parse_all_formats()
+    webpage_url: str
+    extractor_key: str
+
+    @property
+    def canonical_id(self):
+        """
+        Identificador estável do vídeo entre listagens, usuários e reinícios: "extrator id", como no
+        arquivo de downloads do yt-dlp. No extrator genérico o id vem do nome do arquivo e pode repetir
+        entre sites, então a URL da página é usada no lugar.
+        """
+        if not self.extractor_key or self.extractor_key.lower() == 'generic':
+            return f"generic {self.webpage_url}"
+        return f"{self.extractor_key.lower()} {self.video_id}"
+
+
+@functools.lru_cache(maxsize=None)
+def _specific_extractors():
+    """Classes de extrator do yt-dlp, sem o genérico (que aceita qualquer URL)."""
+    return tuple(ie for ie in yt_dlp.extractor.gen_extractor_classes() if ie.ie_key() != 'Generic')
+
+
+@functools.lru_cache(maxsize=4096) # Testar todos os extratores custa caro e a mesma lista é consultada a cada rerun
+def archive_id_for_url(url):
+    """
+    Chave do vídeo no arquivo de downloads, deduzida só da URL, sem extração (como o yt-dlp faz com o
+    seu arquivo de downloads): "extrator id" do primeiro extrator que aceita a URL. Se o id não está na URL
+    (ou nenhum extrator específico a aceita), a própria URL é usada no lugar do id.
+    É a mesma chave ao registrar um download e ao filtrar uma listagem, antes e depois da extração.
+    """
+    for ie in _specific_extractors():
+        if ie.suitable(url):
+            return f"{ie.ie_key().lower()} {ie.get_temp_id(url) or url}"
+    return f"generic {url}"
+
+
+def build_video_record(info):
+    """Monta o VideoRecord a partir do info_dict do yt-dlp."""
+    return VideoRecord(
+        video_id=info.get('id'),
+        title=info.get('title'),
+        duration=info.get('duration'),
+        formats=parse_all_formats(info),
+        webpage_url=info.get('webpage_url') or info.get('original_url'),
+        extractor_key=info.get('extractor_key'),
+    )
+
+
+@dataclass(slots=True, frozen=True)
+class FormatOption:
+    """Uma opção de qualidade de um vídeo, já pronta para exibição."""
+    format_id: str
+    display: str
+    height: int
+    fps: float
+    vcodec: str
+    acodec: str
+    filesize_mb: float # Para formatos apenas vídeo, inclui o áudio pareado (quando ambos os tamanhos são conhecidos)
+    is_combined: bool # Indica se tem áudio e vídeo
+    ext: str = None
+    audio_format_id: str = None # Áudio pareado automaticamente com formatos apenas vídeo
+    size_estimated: bool = False # filesize_mb veio de size_estimation (bitrate ou sondagem), não do extrator
+
+
+@dataclass(slots=True, frozen=True)
+class AudioOption:
+    """Um stream apenas de áudio, candidato a ser pareado com formatos apenas vídeo."""
+    format_id: str
+    acodec: str
+    ext: str
+    abr: float
+    filesize_mb: float
+
+
+# Containers de áudio que podem ser mesclados sem recodificar em cada container de vídeo
+COMPATIBLE_AUDIO_EXTS = {
+    'mp4': ('m4a', 'mp4', 'aac'),
+    'm4v': ('m4a', 'mp4', 'aac'),
+    'webm': ('webm', 'opus', 'ogg'),
+}
+
+
+def parse_audio_formats(info_dict):
+    """Lista os formatos apenas de áudio do info_dict, do melhor para o pior bitrate."""
+    audio_options = []
+    for f in info_dict.get('formats', []):
+        if f.get('vcodec') != 'none' or f.get('acodec') == 'none': # acodec ausente conta como áudio (codec desconhecido)
+            continue
+        filesize_bytes = f.get('filesize') or f.get('filesize_approx') or f.get('filesize_estimate')
+        audio_options.append(AudioOption(
+            format_id=f['format_id'],
+            acodec=f.get('acodec'),
+            ext=f.get('ext'),
+            abr=f.get('abr') or f.get('tbr'),
+            filesize_mb=filesize_bytes / (1024 * 1024) if filesize_bytes else None,
+        ))
+    audio_options.sort(key=lambda a: (a.abr or 0, a.filesize_mb or 0), reverse=True)
+    return audio_options
+
+
+def best_audio_for(video_ext, audio_options):
+    """Escolhe o melhor áudio para um formato apenas vídeo, preferindo containers que mesclam sem recodificar."""
+    if not audio_options:
+        return None
+    compatible = COMPATIBLE_AUDIO_EXTS.get(video_ext, ())
+    return next((a for a in audio_options if a.ext in compatible), audio_options[0])
+
+
+class FormatTable:
+    """
+    Tabela imutável das opções de formato de um vídeo, na ordem de exibição e indexada por format_id.
+    As buscas por format_id são O(1), então os widgets guardam o format_id e não o texto exibido.
+    """
+    __slots__ = ('_options', '_ids', '_positions')
+
+    def __init__(self, options):
+        self._options = tuple(options)
+        self._ids = tuple(option.format_id for option in self._options)
+        self._positions = {format_id: position for position, format_id in enumerate(self._ids)}
+
+    def __len__(self):
+        return len(self._options)
+
+    def __iter__(self):
+        return iter(self._options)
+
+    def __getitem__(self, position):
+        return self._options[position]
+
+    def __contains__(self, format_id):
+        return format_id in self._positions
+
+    def get(self, format_id, default=None):
+        """Retorna a opção com esse format_id, ou `default`."""
+        position = self._positions.get(format_id)
+        return default if position is None else self._options[position]
+
+    def position(self, format_id, default=0):
+        """Posição do format_id na ordem de exibição (para o `index` do selectbox)."""
+        return self._positions.get(format_id, default)
+
+    def ids(self):
+        """Todos os format_ids, na ordem de exibição."""
+        return self._ids
+
+
+def parse_all_formats(info_dict):
+    """
+    Parses all available video formats from yt-dlp info_dict and returns them as a FormatTable,
+    sorted for display (tallest first) and indexed by format_id.
+    """
+    formats = info_dict.get('formats', [])
+    audio_options = parse_audio_formats(info_dict)
+    parsed_options = []
+
+    for f in formats:
+        # Pular formatos sem vídeo ou apenas áudio (a menos que seja um formato específico com boa qualidade)
+        if f.get('vcodec') == 'none' and f.get('acodec') != 'none' and not f.get('is_hls', False):
+            continue # Pula áudio-only a menos que seja um formato que queremos explicitamente
+        if f.get('vcodec') == 'none' and f.get('acodec') == 'none': # Pula se não tem nem vídeo nem áudio
+            continue
+
+        height = f.get('height')
+        # Algumas vezes a altura não está presente para formatos combinados ou adaptativos, tentar inferir
+        if height is None:
+            format_note = f.get('format_note', '')
+            match = re.search(r'(\d{3,4})p', format_note)
+            if match:
+                height = int(match.group(1))
+
+        if not height: # Ainda sem altura, pode ser um formato estranho, pular
+            continue
+
+        filesize_bytes = f.get('filesize') or f.get('filesize_approx')
+        size_estimated = not filesize_bytes and bool(f.get('filesize_estimate'))
+        if size_estimated:
+            filesize_bytes = f['filesize_estimate']
+        filesize_mb = filesize_bytes / (1024 * 1024) if filesize_bytes else None
+        
+        # Cria uma string de exibição clara
+        resolution_str = f"{height}p"
+        if f.get('fps'):
+            resolution_str += f"@{f['fps']}fps"
+
+        paired_audio = None
+        display_string = f"{resolution_str}"
+        if f.get('vcodec') and f['vcodec'] != 'none':
+            display_string += f" ({f['vcodec']}"
+            if f.get('acodec') and f['acodec'] != 'none':
+                display_string += f" + {f['acodec']})"
+            else:
+                paired_audio = best_audio_for(f.get('ext'), audio_options)
+                if paired_audio:
+                    display_string += f" + áudio {paired_audio.acodec or ''} separado)".replace("  ", " ")
+                    if filesize_mb is not None and paired_audio.filesize_mb is not None:
+                        filesize_mb += paired_audio.filesize_mb
+                else:
+                    display_string += " - apenas vídeo)"
+        elif f.get('acodec') and f['acodec'] != 'none':
+            display_string += f" (apenas áudio - {f['acodec']})"
+        
+        if filesize_mb is not None and size_estimated:
+            display_string += f" - ~{filesize_mb:.2f} MB (estimado)"
+        elif filesize_mb is not None:
+            display_string += f" - {filesize_mb:.2f} MB"
+        else:
+            display_string += " - Tamanho N/D"
+
+        parsed_options.append(FormatOption(
+            format_id=f['format_id'],
+            display=display_string,
+            height=height,
+            fps=f.get('fps'),
+            vcodec=f.get('vcodec'),
+            acodec=f.get('acodec'),
+            filesize_mb=filesize_mb,
+            is_combined=(f.get('vcodec') != 'none' and f.get('acodec') != 'none'),
+            ext=f.get('ext'),
+            audio_format_id=paired_audio.format_id if paired_audio else None,
+            size_estimated=size_estimated,
+        ))
+    
+    # Ordenar por altura descendente, e depois por tamanho/bitrate (implícito na ordem do yt-dlp)
+    # Preferir formatos combinados (áudio+vídeo) se houver opções separadas
+    parsed_options.sort(key=lambda x: (x.height if x.height else 0, x.is_combined, x.filesize_mb if x.filesize_mb else 0), reverse=True)
+    
+    return FormatTable(parsed_options)
+
+
+def extract_video_info(url, pool=None, probe_sizes=True):
+    """
+    Extrai as informações do vídeo e devolve o VideoRecord correspondente (serializável com pickle).
+    Sem `pool`, usa as instâncias YoutubeDL do próprio processo (modo pool de processos).
+    Tamanhos ausentes são estimados (ver size_estimation); `probe_sizes` permite consultar o servidor.
+    """
+    global _worker_pool
+    if pool is None:
+        if _worker_pool is None:
+            _worker_pool = YdlPool()
+        pool = _worker_pool
+    try:
+        with pool.lease("info") as ydl:
+            info = ydl.extract_info(url, download=False)
+    except yt_dlp.utils.DownloadError as e:
+        raise ExtractionError(str(e)) from None
+    fill_missing_sizes(info, probe=probe_sizes)
+    return build_video_record(info)
+
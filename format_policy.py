@@ -0,0 +1,167 @@
+import json
+import os
+from dataclasses import dataclass, asdict, fields
+
+import numpy as np
+import pandas as pd
+
+MATRIX_COLUMNS = ('url', 'format_id', 'height', 'fps', 'vcodec', 'acodec', 'filesize_mb', 'is_combined', 'duration')
+
+# Prefixos de vcodec do yt-dlp que correspondem a cada codec preferível num perfil
+CODEC_PREFIXES = {
+    'h264': ('avc1', 'avc3', 'h264'),
+    'h265': ('hvc1', 'hev1', 'h265', 'hevc'),
+    'vp9': ('vp9', 'vp09'),
+    'av1': ('av01', 'av1'),
+}
+
+
+@dataclass(frozen=True)
+class QualityPolicy:
+    """
+    Política de qualidade aplicada ao lote inteiro, ex.: "melhor ≤720p, combinado preferido, h264, até 20 MB/min".
+    Quando nenhum formato de um vídeo atende aos limites, escolhe o menor formato disponível.
+    """
+    max_height: int = None # None = sem limite
+    prefer_combined: bool = True
+    max_size_mb: float = None # None = sem limite; formatos sem tamanho conhecido não são barrados
+    prefer_vcodec: str = None # Chave de CODEC_PREFIXES, ou None para não preferir nenhum
+    max_mb_per_minute: float = None # None = sem limite; exige duração e tamanho conhecidos para barrar
+
+    @classmethod
+    def from_dict(cls, data):
+        """Cria a política a partir do dict salvo em JSON, ignorando campos desconhecidos."""
+        known = {field.name for field in fields(cls)}
+        return cls(**{key: value for key, value in data.items() if key in known})
+
+
+# Perfis disponíveis mesmo sem arquivo salvo; perfis salvos com o mesmo nome os substituem
+DEFAULT_PROFILES = {
+    "Padrão (≤720p, até 300 MB)": QualityPolicy(max_height=720, prefer_combined=True, max_size_mb=300),
+    "Móvel (≤480p, h264)": QualityPolicy(max_height=480, prefer_combined=True, prefer_vcodec='h264', max_mb_per_minute=10),
+    "Arquivo (melhor qualidade)": QualityPolicy(prefer_combined=True),
+}
+
+
+def load_profiles(path):
+    """Carrega os perfis de qualidade salvos (nome -> QualityPolicy), somados aos perfis padrão."""
+    profiles = dict(DEFAULT_PROFILES)
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as fp:
+            saved = json.load(fp)
+        profiles.update({name: QualityPolicy.from_dict(data) for name, data in saved.items()})
+    return profiles
+
+
+def _write_saved_profiles(path, saved):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as fp:
+        json.dump(saved, fp, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def save_profile(path, name, policy):
+    """Salva (ou sobrescreve) um perfil de qualidade no arquivo JSON."""
+    saved = {}
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as fp:
+            saved = json.load(fp)
+    saved[name] = asdict(policy)
+    _write_saved_profiles(path, saved)
+
+
+def delete_profile(path, name):
+    """Remove um perfil salvo. Perfis padrão sobrescritos voltam ao valor original."""
+    if not os.path.exists(path):
+        return
+    with open(path, encoding='utf-8') as fp:
+        saved = json.load(fp)
+    if saved.pop(name, None) is not None:
+        _write_saved_profiles(path, saved)
+
+
+def build_format_matrix(records_by_url):
+    """
+    Junta os formatos de todos os vídeos numa única tabela colunar (uma linha por formato),
+    para que políticas e totais sejam calculados sobre o lote inteiro de uma só vez.
+    """
+    columns = {name: [] for name in MATRIX_COLUMNS}
+    for url, record in records_by_url.items():
+        if not record:
+            continue
+        for option in record.formats:
+            columns['url'].append(url)
+            columns['format_id'].append(option.format_id)
+            columns['height'].append(option.height)
+            columns['fps'].append(option.fps)
+            columns['vcodec'].append(option.vcodec)
+            columns['acodec'].append(option.acodec)
+            columns['filesize_mb'].append(option.filesize_mb)
+            columns['is_combined'].append(option.is_combined)
+            columns['duration'].append(record.duration)
+    matrix = pd.DataFrame(columns, columns=list(MATRIX_COLUMNS))
+    return matrix.astype({
+        'height': 'float64', 'fps': 'float64', 'filesize_mb': 'float64', 'is_combined': 'bool', 'duration': 'float64',
+    })
+
+
+def apply_policy(matrix, policy):
+    """
+    Aplica a política a todos os vídeos numa única passada vetorizada.
+    Retorna uma Series url -> format_id com o formato escolhido para cada vídeo.
+    """
+    if matrix.empty:
+        return pd.Series(dtype=object)
+
+    height = matrix['height'].fillna(0).to_numpy()
+    fps = matrix['fps'].fillna(0).to_numpy()
+    size = matrix['filesize_mb'].to_numpy()
+    size_known = ~np.isnan(size)
+    combined = matrix['is_combined'].to_numpy()
+    minutes = matrix['duration'].to_numpy() / 60
+
+    eligible = np.ones(len(matrix), dtype=bool)
+    if policy.max_height:
+        eligible &= height <= policy.max_height
+    if policy.max_size_mb:
+        eligible &= ~size_known | (size <= policy.max_size_mb)
+    if policy.max_mb_per_minute:
+        with np.errstate(invalid='ignore', divide='ignore'):
+            rate_known = size_known & (minutes > 0)
+            eligible &= ~rate_known | (size / np.where(rate_known, minutes, 1) <= policy.max_mb_per_minute)
+
+    codec_match = np.zeros(len(matrix), dtype=bool)
+    if policy.prefer_vcodec in CODEC_PREFIXES:
+        codec_match = matrix['vcodec'].fillna('').str.startswith(CODEC_PREFIXES[policy.prefer_vcodec]).to_numpy()
+
+    # Chaves de ordenação: entre os elegíveis, a melhor qualidade; entre os demais (fallback), o menor tamanho
+    ranking = pd.DataFrame({
+        'url': matrix['url'].to_numpy(),
+        'format_id': matrix['format_id'].to_numpy(),
+        'eligible': eligible,
+        'combined': np.where(eligible, combined & policy.prefer_combined, False),
+        'height': np.where(eligible, height, 0),
+        'codec': np.where(eligible, codec_match, False),
+        'fps': np.where(eligible, fps, 0),
+        'size_known': size_known,
+        'size': np.where(eligible, -np.nan_to_num(size), np.nan_to_num(size)),
+    })
+    ranking = ranking.sort_values(
+        ['url', 'eligible', 'combined', 'height', 'codec', 'fps', 'size_known', 'size'],
+        ascending=[True, False, False, False, False, False, False, True],
+        kind='stable',
+    )
+    chosen = ranking.drop_duplicates('url', keep='first')
+    return pd.Series(chosen['format_id'].to_numpy(), index=chosen['url'].to_numpy())
+
+
+def summarize_selection(matrix, selection):
+    """
+    Soma o tamanho dos formatos escolhidos (`selection`: url -> format_id).
+    Retorna (total_mb, vídeos_com_tamanho_desconhecido).
+    """
+    if matrix.empty or len(selection) == 0:
+        return 0.0, 0
+    chosen = pd.DataFrame({'url': list(selection.keys()), 'format_id': list(selection.values())})
+    sizes = chosen.merge(matrix[['url', 'format_id', 'filesize_mb']], on=['url', 'format_id'], how='left')['filesize_mb']
+    return float(sizes.sum()), int(sizes.isna().sum())
@@ -0,0 +1,169 @@
+import json
+import os
+import shutil
+import struct
+import subprocess
+from dataclasses import dataclass
+
+# Caixas que abrem um arquivo MP4/MOV (ISO BMFF); o nome do arquivo não diz o container (a saída é sempre .mp4)
+MP4_LEADING_BOXES = (b'ftyp', b'styp', b'moov', b'free', b'skip', b'wide')
+DURATION_TOLERANCE = 0.05 # Diferença relativa aceita entre a duração do arquivo e a do info_dict
+MIN_DURATION_SLACK = 2.0 # Segundos de diferença sempre aceitos (arredondamentos, vídeos curtos)
+PROBE_TIMEOUT = 60
+MAX_REQUEUES = 2 # Novas tentativas de download de um arquivo reprovado antes de desistir
+INTEGRITY_WORKERS = 2
+
+_HANDLER_STREAMS = {b'vide': 'video', b'soun': 'audio'}
+
+
+class CorruptDownloadError(Exception):
+    """O arquivo baixado não passou na verificação de integridade, mesmo depois de baixado de novo."""
+
+
+@dataclass(frozen=True)
+class IntegrityResult:
+    path: str
+    problems: tuple = () # Descrições do que está errado; vazio = arquivo íntegro
+
+    @property
+    def ok(self):
+        return not self.problems
+
+
+def probe_file(path, expected_duration=None, expected_streams=()):
+    """
+    Verifica o container de um arquivo baixado: MP4 com átomo moov, streams esperados ('video', 'audio')
+    presentes e duração compatível com a do info_dict. O container é reconhecido pelo conteúdo: MP4 é lido
+    direto (só os cabeçalhos das caixas); outros (WebM, FLV...) passam pelo ffprobe, quando instalado.
+    Roda num processo do pool de integridade.
+    """
+    if not os.path.isfile(path) or os.path.getsize(path) == 0:
+        return IntegrityResult(path, ("arquivo ausente ou vazio",))
+    if is_mp4(path):
+        probed = _probe_mp4(path)
+    elif shutil.which('ffprobe'):
+        probed = _probe_ffprobe(path)
+    else:
+        return IntegrityResult(path) # Sem como inspecionar o container: só o tamanho foi verificado
+    problems, duration, streams = probed
+    problems = list(problems)
+    for stream in expected_streams:
+        if streams is not None and stream not in streams:
+            problems.append(f"sem stream de {'vídeo' if stream == 'video' else 'áudio'}")
+    if expected_duration and duration:
+        slack = max(expected_duration * DURATION_TOLERANCE, MIN_DURATION_SLACK)
+        if abs(duration - expected_duration) > slack:
+            problems.append(f"duração de {duration:.1f}s, esperada {expected_duration:.1f}s")
+    return IntegrityResult(path, tuple(problems))
+
+
+def is_mp4(path):
+    """Verifica se o arquivo começa com uma caixa de MP4/MOV (normalmente 'ftyp')."""
+    with open(path, 'rb') as fp:
+        head = fp.read(8)
+    return len(head) == 8 and head[4:8] in MP4_LEADING_BOXES
+
+
+def _probe_mp4(path):
+    """(problemas, duração em segundos ou None, streams) de um MP4, percorrendo as caixas de nível superior."""
+    size = os.path.getsize(path)
+    problems = []
+    duration = None
+    streams = set()
+    has_moov = has_media = False
+    with open(path, 'rb') as fp:
+        try:
+            for box_type, start, end in _boxes(fp, 0, size):
+                has_media = has_media or box_type in (b'mdat', b'moof')
+                if end > size:
+                    problems.append(f"arquivo truncado na caixa '{box_type.decode('latin-1')}'")
+                    break
+                if box_type == b'moov':
+                    has_moov = True
+                    duration, streams = _read_moov(fp, start, end)
+        except (struct.error, IndexError):
+            problems.append("estrutura do MP4 inválida")
+    if not has_moov:
+        problems.append("sem átomo moov (índice do MP4)")
+    if not has_media:
+        problems.append("sem dados de mídia (mdat)")
+    return problems, duration, streams if has_moov else None
+
+
+def _read_moov(fp, start, end):
+    duration = None
+    streams = set()
+    for box_type, child_start, child_end in _boxes(fp, start, end):
+        if box_type == b'mvhd':
+            fp.seek(child_start)
+            version = fp.read(4)[0]
+            if version == 1:
+                fp.seek(16, os.SEEK_CUR)
+                timescale, units = struct.unpack('>IQ', fp.read(12))
+            else:
+                fp.seek(8, os.SEEK_CUR)
+                timescale, units = struct.unpack('>II', fp.read(8))
+            if timescale and units:
+                duration = units / timescale # Zero em MP4 fragmentado: a duração fica sem verificar
+        elif box_type == b'trak':
+            handler = _find_handler(fp, child_start, child_end)
+            if handler in _HANDLER_STREAMS:
+                streams.add(_HANDLER_STREAMS[handler])
+    return duration, streams
+
+
+def _find_handler(fp, start, end):
+    """Tipo do handler (trak > mdia > hdlr) de uma trilha: b'vide', b'soun'..."""
+    for box_type, mdia_start, mdia_end in _boxes(fp, start, end):
+        if box_type == b'mdia':
+            for child_type, child_start, _ in _boxes(fp, mdia_start, mdia_end):
+                if child_type == b'hdlr':
+                    fp.seek(child_start + 8)
+                    return fp.read(4)
+    return None
+
+
+def _boxes(fp, start, end):
+    """Caixas (tipo, início do conteúdo, fim) entre `start` e `end`; o fim pode passar de `end` se estiver truncado."""
+    position = start
+    while position + 8 <= end:
+        fp.seek(position)
+        header = fp.read(8)
+        if len(header) < 8:
+            return
+        box_size, box_type = struct.unpack('>I4s', header)
+        header_size = 8
+        if box_size == 1:
+            box_size = struct.unpack('>Q', fp.read(8))[0]
+            header_size = 16
+        elif box_size == 0:
+            box_size = end - position # Vai até o fim do arquivo
+        if box_size < header_size:
+            return
+        yield box_type, position + header_size, position + box_size
+        position += box_size
+
+
+def _probe_ffprobe(path):
+    """(problemas, duração, streams) pelo ffprobe, para containers que não são MP4."""
+    result = subprocess.run(
+        ['ffprobe', '-v', 'error', '-show_entries', 'format=duration:stream=codec_type', '-of', 'json', path],
+        capture_output=True, text=True, timeout=PROBE_TIMEOUT)
+    if result.returncode != 0:
+        return [f"container ilegível: {result.stderr.strip() or 'ffprobe falhou'}"], None, None
+    data = json.loads(result.stdout or '{}')
+    duration = data.get('format', {}).get('duration')
+    streams = {stream.get('codec_type') for stream in data.get('streams', [])}
+    return [], float(duration) if duration else None, streams
+
+
+class IntegrityVerifier:
+    """Envia a verificação dos arquivos concluídos ao pool de processos, fora das threads de download."""
+
+    def __init__(self, process_pool, max_requeues=MAX_REQUEUES):
+        self.process_pool = process_pool
+        self.max_requeues = max_requeues
+
+    def check(self, path, expected_duration=None, expected_streams=()):
+        """Agenda probe_file e retorna o Future do IntegrityResult."""
+        return self.process_pool.submit(probe_file, path, expected_duration, tuple(expected_streams))
@@ -0,0 +1,97 @@
+import os
+import re
+import time
+from dataclasses import dataclass
+
+from download_catalog import LINK_SUFFIX
+from job_journal import FAILED, RUNNING, is_active
+from segmented_download import PART_SUFFIX
+from staging import STAGING_SUFFIX
+
+RESUME_WINDOW = 3 * 86400 # Por quanto tempo os restos retomáveis de um download que falhou são mantidos
+UNTRACKED_GRACE = 600 # Restos sem registro no diário só são removidos depois de parados por esse tempo
+
+# Estado parcial do próprio yt-dlp, que ele retoma ao baixar de novo a mesma saída
+_YTDLP_STATE_RE = re.compile(r'\.(part|ytdl|part-Frag\d+(\.part)?)$')
+# Stream completo de um par vídeo+áudio ainda não mesclado (`.f137.mp4`), que o yt-dlp reaproveita
+_STREAM_RE = re.compile(r'\.f[\w-]+\.\w+')
+
+
+@dataclass(frozen=True)
+class JanitorReport:
+    reclaimed_files: int = 0
+    reclaimed_bytes: int = 0
+    kept_files: int = 0 # Restos mantidos: downloads em andamento ou que ainda podem ser retomados
+    kept_bytes: int = 0
+
+
+def leftover_owner(filename):
+    """
+    Para um arquivo que sobrou de um download, a base (nome sem extensão) da saída a que ele pertence
+    e se ele pode ser retomado; None se o arquivo não é um resto de download.
+    """
+    if filename.endswith(PART_SUFFIX):
+        name, resumable = filename[:-len(PART_SUFFIX)], False # Download nativo: sempre recomeça do zero
+    elif match := _YTDLP_STATE_RE.search(filename):
+        name, resumable = filename[:match.start()], True
+    elif filename.endswith(LINK_SUFFIX):
+        return os.path.splitext(filename[:-len(LINK_SUFFIX)])[0], False
+    else:
+        name, resumable = filename, None
+    head, sep, tail = name.rpartition(STAGING_SUFFIX)
+    if not sep:
+        if resumable is None:
+            return None # Arquivo publicado (ou de fora do aplicativo)
+        return os.path.splitext(name)[0], resumable
+    if resumable is None:
+        # Arquivo temporário completo: só os streams de um par são reaproveitados; uma saída não publicada
+        # pode estar pela metade (ex.: mescla interrompida), e os intermediários do ffmpeg são descartáveis
+        resumable = bool(_STREAM_RE.fullmatch(tail))
+    return head, resumable
+
+
+def sweep(directory, journal, now=None):
+    """
+    Percorre o diretório de downloads e remove os restos de downloads (.part, .ytdl, .fNNN, temporários)
+    que não servem mais, ligando cada um à sua saída no diário:
+    os de downloads em andamento ficam; os retomáveis de downloads que falharam (ou foram interrompidos)
+    há menos de RESUME_WINDOW ficam, para a próxima tentativa continuar de onde parou; o resto é removido.
+    Retorna o JanitorReport.
+    """
+    now = now or time.time()
+    if not os.path.isdir(directory):
+        return JanitorReport()
+    jobs_by_base = {}
+    for output_filepath, entry in journal.entries().items():
+        jobs_by_base.setdefault(os.path.splitext(output_filepath)[0], []).append(entry)
+
+    reclaimed_files = reclaimed_bytes = kept_files = kept_bytes = 0
+    for entry in os.scandir(directory):
+        if not entry.is_file(follow_symlinks=False):
+            continue
+        owner = leftover_owner(entry.name)
+        if owner is None:
+            continue
+        base, resumable = owner
+        size = entry.stat().st_size
+        if _keep(jobs_by_base.get(os.path.abspath(os.path.join(directory, base)), []), resumable, entry.stat().st_mtime, now):
+            kept_files += 1
+            kept_bytes += size
+            continue
+        try:
+            os.remove(entry.path)
+        except FileNotFoundError:
+            continue
+        reclaimed_files += 1
+        reclaimed_bytes += size
+    journal.prune(now - RESUME_WINDOW)
+    return JanitorReport(reclaimed_files, reclaimed_bytes, kept_files, kept_bytes)
+
+
+def _keep(jobs, resumable, mtime, now):
+    if not jobs:
+        return now - mtime < UNTRACKED_GRACE # Sem registro: só se ainda pode estar sendo escrito
+    if any(is_active(job) for job in jobs):
+        return True
+    retry_pending = any(job['state'] in (FAILED, RUNNING) and now - job['updated_at'] < RESUME_WINDOW for job in jobs)
+    return resumable and retry_pending
@@ -0,0 +1,124 @@
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    output_filepath TEXT PRIMARY KEY,
+    video_url TEXT,
+    state TEXT NOT NULL,
+    pid INTEGER,
+    owner TEXT,
+    error TEXT,
+    started_at REAL,
+    updated_at REAL
+);
+"""
+
+# Estados de uma saída no diário
+RUNNING = 'running'
+FAILED = 'failed'
+COMPLETED = 'completed'
+
+
+def process_start_time(pid):
+    """Início do processo em ticks desde o boot (/proc/<pid>/stat, campo 22); None se não existe ou fora do Linux."""
+    try:
+        with open(f"/proc/{pid}/stat", 'rb') as fp:
+            stat = fp.read()
+    except OSError:
+        return None
+    return int(stat.rsplit(b')', 1)[1].split()[19]) # Campos contados depois do nome, que pode ter espaços
+
+
+# Dono das saídas iniciadas por este processo: o pid sozinho se repete (ex.: um contêiner reiniciado volta com
+# o mesmo pid), pid + instante de início não. Sem /proc, um identificador aleatório no lugar do instante.
+PROCESS_TOKEN = f"{os.getpid()}:{process_start_time(os.getpid()) or uuid.uuid4().hex}"
+
+
+class JobJournal:
+    """
+    Diário persistente (SQLite) das saídas de download: quando começaram, se terminaram ou falharam e
+    em qual processo rodavam. É o que permite saber, depois de uma falha ou de uma queda do servidor,
+    a que download pertence cada arquivo incompleto no diretório e se ele ainda pode ser retomado.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript(_SCHEMA)
+        self._migrate()
+
+    def _migrate(self):
+        """Acrescenta a coluna `owner` a diários criados antes dela."""
+        existing = {row['name'] for row in self._db.execute("PRAGMA table_info(jobs)")}
+        if 'owner' not in existing:
+            self._db.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def start(self, output_filepath, video_url):
+        now = time.time()
+        self._write(
+            "INSERT INTO jobs (output_filepath, video_url, state, pid, owner, error, started_at, updated_at) VALUES (?, ?, ?, ?, ?, NULL, ?, ?) "
+            "ON CONFLICT (output_filepath) DO UPDATE SET video_url = excluded.video_url, state = excluded.state, "
+            "pid = excluded.pid, owner = excluded.owner, error = NULL, updated_at = excluded.updated_at",
+            (os.path.abspath(output_filepath), video_url, RUNNING, os.getpid(), PROCESS_TOKEN, now, now))
+
+    def fail(self, output_filepath, error=None):
+        self._write("UPDATE jobs SET state = ?, error = ?, updated_at = ? WHERE output_filepath = ?",
+                    (FAILED, error, time.time(), os.path.abspath(output_filepath)))
+
+    def finish(self, output_filepath):
+        self._write("UPDATE jobs SET state = ?, error = NULL, updated_at = ? WHERE output_filepath = ?",
+                    (COMPLETED, time.time(), os.path.abspath(output_filepath)))
+
+    def entries(self):
+        """Todas as saídas do diário: caminho final -> dict (state, pid, owner, video_url, error, started_at, updated_at)."""
+        with self._lock:
+            rows = self._db.execute("SELECT * FROM jobs").fetchall()
+        return {row['output_filepath']: dict(row) for row in rows}
+
+    def prune(self, updated_before):
+        """
+        Esquece as saídas sem atividade desde `updated_before`: concluídas, falhas e as interrompidas
+        (em andamento num processo que não existe mais). As em andamento de verdade ficam.
+        """
+        stale = [(path,) for path, entry in self.entries().items() if entry['updated_at'] < updated_before and not is_active(entry)]
+        with self._lock:
+            self._db.executemany("DELETE FROM jobs WHERE output_filepath = ?", stale)
+            self._db.commit()
+
+    def _write(self, sql, params):
+        with self._lock:
+            self._db.execute(sql, params)
+            self._db.commit()
+
+
+def is_active(entry):
+    """A saída está sendo baixada agora: marcada como em andamento por um processo que ainda existe (o mesmo PROCESS_TOKEN)."""
+    if entry['state'] != RUNNING:
+        return False
+    owner = entry.get('owner')
+    if owner == PROCESS_TOKEN:
+        return True
+    if not owner:
+        return False # Gravada antes do PROCESS_TOKEN, por um processo anterior a este: interrompida
+    pid, _, started = owner.partition(':')
+    if started.isdigit():
+        return process_start_time(int(pid)) == int(started) # Outro pid, ou o mesmo reaproveitado: interrompida
+    try:
+        os.kill(int(pid), 0) # Sem /proc: só dá para saber se o pid existe
+    except ProcessLookupError:
+        return False # O processo morreu no meio do download: a saída foi interrompida
+    except PermissionError:
+        pass # Processo de outro usuário (existe): na dúvida, considera ativo
+    return True
@@ -0,0 +1,132 @@
+import secrets
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+import urllib3
+
+from segmented_download import RANGE_PROTOCOLS, REQUEST_TIMEOUT
+
+CHUNK_BYTES = 64 * 1024 # Pequeno: o player recebe os primeiros bytes assim que chegam da origem
+MAX_STREAMS = 256 # Pré-visualizações registradas ao mesmo tempo (as mais antigas são esquecidas)
+# Cabeçalhos da resposta da origem repassados ao player (o suficiente para Range e seek funcionarem)
+FORWARDED_HEADERS = ('Content-Type', 'Content-Length', 'Content-Range', 'Accept-Ranges', 'Content-Encoding', 'Last-Modified', 'ETag')
+
+
+def preview_source(ydl, video_url):
+    """
+    URL direta e cabeçalhos HTTP de um formato, para a pré-visualização; None se o formato não é progressivo
+    (HLS/DASH só tocam no navegador com um player próprio) ou se combina vários formatos.
+    `ydl` é uma instância YoutubeDL (do YdlPool) já com o formato escolhido.
+    """
+    info = ydl.extract_info(video_url, download=False)
+    if info.get('requested_formats') or info.get('protocol') not in RANGE_PROTOCOLS or not info.get('url'):
+        return None
+    return info['url'], dict(info.get('http_headers') or {})
+
+
+class PreviewProxy:
+    """
+    Proxy HTTP que repassa as requisições do player do navegador (com Range) para a URL de origem
+    de um formato, com os cabeçalhos do yt-dlp (User-Agent, Referer...) que a origem exige.
+    O vídeo começa a tocar com os primeiros bytes e o seek pede só o trecho necessário; nada é gravado em disco.
+    Como quem acessa é o navegador, o proxy precisa escutar num endereço que os usuários alcançam;
+    só os tokens registrados são repassados (não é um proxy aberto).
+    """
+
+    def __init__(self, host='0.0.0.0', port=0):
+        self._streams = OrderedDict() # token -> (URL de origem, cabeçalhos)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _PreviewHandler)
+        self._server.daemon_threads = True
+        self._server.proxy = self
+        self._thread = None
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._server.serve_forever, name="preview-proxy", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._server.shutdown()
+        self._server.server_close()
+
+    def register(self, url, headers=None):
+        """Registra a URL de origem e retorna o caminho dela no proxy (a juntar ao endereço público do proxy)."""
+        with self._lock:
+            for token, (known_url, _) in self._streams.items():
+                if known_url == url:
+                    self._streams.move_to_end(token)
+                    break
+            else:
+                token = secrets.token_urlsafe(16)
+                self._streams[token] = (url, dict(headers or {}))
+                while len(self._streams) > MAX_STREAMS:
+                    self._streams.popitem(last=False)
+        return f"/preview/{token}"
+
+    def forward(self, handler, send_body=True):
+        """Atende uma requisição do player repassando-a à origem e devolvendo a resposta à medida que chega."""
+        with self._lock:
+            stream = self._streams.get(handler.path.rsplit('/', 1)[-1])
+        if stream is None:
+            handler.send_error(404)
+            return
+        url, headers = stream
+        request_headers = dict(headers)
+        for name in ('Range', 'If-Range'):
+            if handler.headers.get(name):
+                request_headers[name] = handler.headers[name]
+        try:
+            upstream = handler.session.request(
+                'GET' if send_body else 'HEAD', url, headers=request_headers,
+                timeout=REQUEST_TIMEOUT, stream=True, allow_redirects=True)
+        except requests.exceptions.RequestException:
+            handler.send_error(502)
+            return
+        with upstream:
+            handler.send_response(upstream.status_code)
+            for name in FORWARDED_HEADERS:
+                if name in upstream.headers:
+                    handler.send_header(name, upstream.headers[name])
+            if 'Content-Length' not in upstream.headers:
+                handler.close_connection = True # Sem tamanho, o fim da resposta é o fim da conexão
+            handler.end_headers()
+            if not send_body:
+                return
+            try:
+                for chunk in upstream.raw.stream(CHUNK_BYTES, decode_content=False):
+                    handler.wfile.write(chunk)
+            except (urllib3.exceptions.HTTPError, OSError):
+                # O player cancelou (seek, página fechada) ou a origem caiu no meio: a resposta ficou incompleta
+                handler.close_connection = True
+
+
+class _PreviewHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1' # Keep-alive: o player faz várias requisições com Range
+
+    def setup(self):
+        super().setup()
+        # Uma Session por conexão do player: as conexões com a origem ficam abertas entre os seeks e fecham com ela
+        self.session = requests.Session()
+
+    def finish(self):
+        try:
+            super().finish()
+        finally:
+            self.session.close()
+
+    def do_GET(self):
+        self.server.proxy.forward(self)
+
+    def do_HEAD(self):
+        self.server.proxy.forward(self, send_body=False)
+
+    def log_message(self, format, *args):
+        pass
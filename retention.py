@@ -0,0 +1,123 @@
+import json
+import os
+import threading
+import time
+from dataclasses import asdict, dataclass
+
+DEFAULT_INTERVAL = 60.0 # Segundos entre as passadas de retenção quando o diretório está dentro dos limites
+STEP_ITEMS = 20 # Conteúdos removidos, no máximo, por passada
+STEP_PAUSE = 0.5 # Pausa entre passadas seguidas enquanto ainda há o que remover
+GRACE_SECONDS = 600 # Conteúdo usado há menos que isso nunca é removido pelo limite de tamanho
+
+
+@dataclass(frozen=True)
+class RetentionPolicy:
+    """Limites do diretório de downloads; None = sem limite naquele critério."""
+    max_total_bytes: int = None # Espaço total dos arquivos do catálogo
+    max_age_seconds: float = None # Tempo sem uso (download ou acesso) até o arquivo ser removido
+
+
+def load_policy(path):
+    """Lê a RetentionPolicy salva por save_policy(); sem arquivo, a política sem limites."""
+    if not os.path.exists(path):
+        return RetentionPolicy()
+    with open(path, encoding='utf-8') as fp:
+        return RetentionPolicy(**json.load(fp))
+
+
+def save_policy(path, policy):
+    """Grava a RetentionPolicy em JSON (substituindo o arquivo de uma vez, como os perfis de qualidade)."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as fp:
+        json.dump(asdict(policy), fp, indent=2)
+    os.replace(tmp_path, path)
+
+
+@dataclass(frozen=True)
+class EvictionReport:
+    files: int = 0
+    bytes_freed: int = 0
+    exhausted: bool = False # A passada atingiu o limite de conteúdos: pode haver mais a remover
+
+
+class RetentionManager:
+    """
+    Mantém os arquivos do DownloadCatalog dentro da RetentionPolicy, removendo em segundo plano
+    primeiro os expirados e depois os menos recentemente usados (LRU pelo último acesso).
+
+    Cada passada remove no máximo `step_items` conteúdos (um conteúdo = todos os seus hard links),
+    então nem o catálogo nem o disco ficam presos por muito tempo; enquanto houver excesso, as
+    passadas se seguem com uma pequena pausa, e depois voltam ao intervalo normal.
+    """
+
+    def __init__(self, catalog, policy=None, interval=DEFAULT_INTERVAL, step_items=STEP_ITEMS):
+        self.catalog = catalog
+        self.policy = policy or RetentionPolicy()
+        self.interval = interval
+        self.step_items = step_items
+        self.evicted_files = 0
+        self.evicted_bytes = 0
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def configure(self, policy):
+        """Troca os limites; se mudaram, a próxima passada acontece logo."""
+        if policy != self.policy:
+            self.policy = policy
+            self._wake.set()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="retention", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._wake.set()
+
+    def evict_step(self):
+        """Uma passada limitada: remove até `step_items` conteúdos expirados ou excedentes. Retorna o EvictionReport."""
+        policy = self.policy
+        now = time.time()
+        budget = self.step_items
+        files = freed = 0
+        if policy.max_age_seconds:
+            for content in self.catalog.least_recently_used(budget, used_before=now - policy.max_age_seconds):
+                files += self._evict(content)
+                freed += content['size']
+                budget -= 1
+        if policy.max_total_bytes and budget > 0:
+            excess = self.catalog.stored_bytes() - policy.max_total_bytes
+            if excess > 0:
+                for content in self.catalog.least_recently_used(budget, used_before=now - GRACE_SECONDS):
+                    if excess <= 0:
+                        break
+                    files += self._evict(content)
+                    freed += content['size']
+                    excess -= content['size']
+                    budget -= 1
+        self.evicted_files += files
+        self.evicted_bytes += freed
+        return EvictionReport(files, freed, exhausted=budget <= 0)
+
+    def _evict(self, content):
+        """Apaga todos os caminhos de um conteúdo e os tira do catálogo. Retorna quantos arquivos existiam."""
+        removed = 0
+        for path in content['paths']:
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+        self.catalog.forget(content['paths'])
+        return removed
+
+    def _loop(self):
+        while not self._stopped.is_set():
+            try:
+                report = self.evict_step()
+            except Exception:
+                report = EvictionReport() # Catálogo fechado ou disco indisponível: tenta na próxima passada
+            self._wake.wait(STEP_PAUSE if report.exhausted else self.interval)
+            self._wake.clear()
@@ -0,0 +1,385 @@
+import concurrent.futures
+import contextlib
+import os
+import re
+import threading
+from urllib.parse import urljoin
+
+import requests
+
+REQUEST_TIMEOUT = 20 # Segundos por requisição de fragmento
+FRAGMENT_RETRIES = 3
+FRAGMENT_PROTOCOLS = ('m3u8_native', 'http_dash_segments')
+RANGE_PROTOCOLS = ('http', 'https')
+MIN_SPLIT_BYTES = 4 * 1024 * 1024 # Arquivos menores que isso não compensam várias conexões
+MIN_STEAL_BYTES = 1024 * 1024 # Só divide um trecho em andamento se sobrar pelo menos isso
+CHUNK_BYTES = 256 * 1024
+PART_SUFFIX = ".native.part" # Diferente do .part do yt-dlp: estes não podem ser retomados
+
+_BYTERANGE_RE = re.compile(r'(\d+)(?:@(\d+))?')
+_ATTRIBUTE_RE = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+
+
+class UnsupportedStream(Exception):
+    """O stream não pode ser baixado pelo downloader nativo (criptografado, ao vivo...); usar o yt-dlp."""
+
+
+class SourceAddressAdapter(requests.adapters.HTTPAdapter):
+    """Adaptador que abre as conexões a partir de um endereço local específico (a opção source_address do yt-dlp)."""
+
+    def __init__(self, source_address, **kwargs):
+        self.source_address = (source_address, 0)
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs['source_address'] = self.source_address
+        super().init_poolmanager(*args, **kwargs)
+
+    def proxy_manager_for(self, proxy, **kwargs):
+        kwargs['source_address'] = self.source_address
+        return super().proxy_manager_for(proxy, **kwargs)
+
+
+def build_session(cookies=None, proxy=None, source_address=None, verify=True):
+    """
+    Session para os downloaders nativos com o mesmo acesso que o yt-dlp teria: `cookies` (CookieJar, ex.:
+    YoutubeDL.cookiejar, com os de --cookies/--cookies-from-browser e os definidos na extração), `proxy`
+    e `source_address` como nas opções do yt-dlp, e `verify` = False para nocheckcertificate.
+    """
+    session = requests.Session()
+    if cookies is not None:
+        session.cookies = cookies
+    if proxy:
+        session.proxies = {'http': proxy, 'https': proxy}
+    if source_address:
+        adapter = SourceAddressAdapter(source_address)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+    session.verify = verify
+    return session
+
+
+def _session_scope(session):
+    """A Session recebida (fechada por quem a criou) ou uma nova, fechada ao fim do bloco."""
+    return contextlib.nullcontext(session) if session is not None else requests.Session()
+
+
+class ConcurrencyTuner:
+    """
+    Ajusta por host o número de requisições simultâneas a partir da vazão observada (subida de encosta):
+    enquanto aumentar a concorrência melhora a vazão, continua aumentando; quando piora, volta um passo.
+    """
+
+    def __init__(self, initial=4, minimum=1, maximum=16, tolerance=0.1):
+        self.initial = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.tolerance = tolerance
+        self._lock = threading.Lock()
+        self._state = {} # host -> [concorrência atual, vazão da última medição, direção (+1/-1)]
+
+    def current(self, host):
+        with self._lock:
+            return self._state.get(host, [self.initial])[0]
+
+    def record(self, host, concurrency, nbytes, seconds):
+        """Registra uma transferência feita com `concurrency` e escolhe a concorrência da próxima."""
+        if not nbytes or seconds <= 0:
+            return
+        rate = nbytes / seconds
+        with self._lock:
+            state = self._state.setdefault(host, [concurrency, None, 1])
+            _, last_rate, direction = state
+            if last_rate is not None and rate < last_rate * (1 - self.tolerance):
+                direction = -direction # Piorou: inverte o sentido
+            elif last_rate is not None and rate < last_rate * (1 + self.tolerance):
+                state[1] = rate
+                return # Dentro da tolerância: mantém a concorrência
+            state[0] = min(max(concurrency + direction * max(1, concurrency // 2), self.minimum), self.maximum)
+            state[1] = rate
+            state[2] = direction
+
+
+def fragment_list(fmt, session):
+    """
+    Lista os fragmentos do formato (HLS ou DASH) como dicts {'url', 'range'}, na ordem de gravação.
+    `range` é (início, fim inclusivo) ou None. Levanta UnsupportedStream para o que só o yt-dlp trata.
+    """
+    if fmt.get('fragments'):
+        base_url = fmt.get('fragment_base_url')
+        fragments = []
+        for fragment in fmt['fragments']:
+            url = fragment.get('url') or (base_url and urljoin(base_url, fragment.get('path', '')))
+            if not url:
+                raise UnsupportedStream("Fragmento DASH sem URL.")
+            fragments.append({'url': url, 'range': None})
+        return fragments
+    if fmt.get('protocol') == 'm3u8_native':
+        return _hls_fragments(fmt['url'], session, fmt.get('http_headers'))
+    raise UnsupportedStream(f"Protocolo não suportado: {fmt.get('protocol')}")
+
+
+def _hls_fragments(playlist_url, session, headers=None):
+    response = session.get(playlist_url, headers=headers, timeout=REQUEST_TIMEOUT)
+    response.raise_for_status()
+    lines = [line.strip() for line in response.text.splitlines() if line.strip()]
+    if any(line.startswith('#EXT-X-STREAM-INF') for line in lines):
+        raise UnsupportedStream("Playlist mestre em vez de playlist de mídia.")
+    if '#EXT-X-ENDLIST' not in lines:
+        raise UnsupportedStream("Transmissão ao vivo.")
+
+    fragments = []
+    byte_range = None
+    next_offset = 0
+    for line in lines:
+        if line.startswith('#EXT-X-KEY'):
+            attributes = _attributes(line)
+            if attributes.get('METHOD', 'NONE') != 'NONE':
+                raise UnsupportedStream("Segmentos criptografados.")
+        elif line.startswith('#EXT-X-MAP'):
+            attributes = _attributes(line)
+            map_range = None
+            if 'BYTERANGE' in attributes:
+                map_range, _ = _parse_byterange(attributes['BYTERANGE'], 0)
+            fragments.append({'url': urljoin(response.url, attributes['URI']), 'range': map_range})
+        elif line.startswith('#EXT-X-BYTERANGE:'):
+            byte_range, next_offset = _parse_byterange(line.split(':', 1)[1], next_offset)
+        elif not line.startswith('#'):
+            fragments.append({'url': urljoin(response.url, line), 'range': byte_range})
+            byte_range = None
+    return fragments
+
+
+def _attributes(line):
+    return {key: value.strip('"') for key, value in _ATTRIBUTE_RE.findall(line.split(':', 1)[1])}
+
+
+def _parse_byterange(spec, next_offset):
+    """'tamanho[@início]' -> ((início, fim inclusivo), início do próximo)."""
+    length, offset = _BYTERANGE_RE.match(spec).groups()
+    start = int(offset) if offset is not None else next_offset
+    return (start, start + int(length) - 1), start + int(length)
+
+
+def fetch_fragment(session, fragment, headers=None):
+    """Baixa um fragmento inteiro para a memória, com novas tentativas."""
+    request_headers = dict(headers or {})
+    if fragment['range']:
+        request_headers['Range'] = 'bytes=%d-%d' % fragment['range']
+    for attempt in range(FRAGMENT_RETRIES + 1):
+        try:
+            response = session.get(fragment['url'], headers=request_headers, timeout=REQUEST_TIMEOUT)
+            response.raise_for_status()
+            return response.content
+        except requests.exceptions.RequestException:
+            if attempt == FRAGMENT_RETRIES:
+                raise
+
+
+def download_fragments(fragments, output_filepath, concurrency, headers=None, progress=None, expected_bytes=None, hasher=None, session=None):
+    """
+    Baixa os fragmentos com `concurrency` requisições simultâneas e grava cada um, na ordem, direto
+    no arquivo de saída (sem arquivos intermediários por fragmento). No máximo 2 × `concurrency`
+    fragmentos ficam em memória. `progress(bytes_gravados)` é chamado após cada fragmento.
+    Com `expected_bytes`, o arquivo é pré-alocado e depois cortado no tamanho real.
+    Com `hasher` (StreamingHasher), cada fragmento entra no hash ao ser gravado.
+    `session` é a Session a usar (ver build_session); sem ela, uma nova, sem cookies nem proxy.
+    Retorna o total de bytes gravados.
+    """
+    part_path = f"{output_filepath}{PART_SUFFIX}"
+    written = 0
+    window = max(1, concurrency) * 2
+    with _session_scope(session) as session, \
+            concurrent.futures.ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor, \
+            open(part_path, 'wb') as output:
+        if expected_bytes:
+            preallocate(output.fileno(), int(expected_bytes))
+        pending = iter(fragments)
+        in_flight = []
+        try:
+            for fragment in pending:
+                in_flight.append(executor.submit(fetch_fragment, session, fragment, headers))
+                if len(in_flight) >= window:
+                    break
+            while in_flight:
+                data = in_flight.pop(0).result()
+                output.write(data)
+                if hasher is not None:
+                    hasher.update(data)
+                written += len(data)
+                if progress is not None:
+                    progress(written)
+                next_fragment = next(pending, None)
+                if next_fragment is not None:
+                    in_flight.append(executor.submit(fetch_fragment, session, next_fragment, headers))
+        except BaseException:
+            for future in in_flight:
+                future.cancel()
+            output.close()
+            _remove_part(part_path)
+            raise
+        output.truncate(written)
+    os.replace(part_path, output_filepath)
+    return written
+
+
+def probe_range_size(url, session, headers=None):
+    """Tamanho total do recurso se o servidor aceitar requisições com Range (resposta 206), senão None."""
+    range_headers = dict(headers or {}, Range='bytes=0-0')
+    with session.get(url, headers=range_headers, timeout=REQUEST_TIMEOUT, stream=True) as response:
+        content_range = response.headers.get('Content-Range', '')
+        if response.status_code == 206 and '/' in content_range and not content_range.endswith('/*'):
+            return int(content_range.rsplit('/', 1)[1])
+    return None
+
+
+class _Segment:
+    """Trecho [position, end] (inclusivo) ainda por baixar; `end` pode encolher quando outro worker rouba a metade final."""
+    __slots__ = ('position', 'end', 'active')
+
+    def __init__(self, start, end):
+        self.position = start
+        self.end = end
+        self.active = False
+
+    def remaining(self):
+        return self.end - self.position + 1
+
+
+class _RangeWork:
+    """Fila de trechos com roubo de trabalho: quem fica sem trecho divide ao meio o maior trecho em andamento."""
+
+    def __init__(self, size, parts):
+        step = -(-size // parts)
+        self._size = size
+        self._lock = threading.Lock()
+        self._segments = [_Segment(start, min(start + step, size) - 1) for start in range(0, size, step)]
+        self.written = 0
+
+    def take(self):
+        """Próximo trecho livre, ou metade do maior trecho em andamento; None quando não há o que fazer."""
+        with self._lock:
+            for segment in self._segments:
+                if not segment.active and segment.remaining() > 0:
+                    segment.active = True
+                    return segment
+            victim = max((s for s in self._segments if s.active), key=_Segment.remaining, default=None)
+            if victim is None or victim.remaining() < 2 * MIN_STEAL_BYTES:
+                return None
+            middle = victim.position + victim.remaining() // 2
+            stolen = _Segment(middle, victim.end)
+            stolen.active = True
+            victim.end = middle - 1
+            self._segments.append(stolen)
+            return stolen
+
+    def advance(self, segment, nbytes):
+        """Registra `nbytes` gravados no trecho; retorna quanto ainda cabe nele (0 = parar)."""
+        with self._lock:
+            segment.position += nbytes
+            self.written += nbytes
+            return segment.remaining()
+
+    def limit(self, segment, nbytes):
+        """Quantos dos `nbytes` recebidos ainda pertencem ao trecho (o fim pode ter sido roubado)."""
+        with self._lock:
+            return max(min(nbytes, segment.remaining()), 0)
+
+    def frontier(self):
+        """Tamanho do início contíguo já gravado do arquivo (tudo antes do primeiro byte ainda por baixar)."""
+        with self._lock:
+            return min((s.position for s in self._segments if s.remaining() > 0), default=self._size)
+
+    def release(self, segment):
+        with self._lock:
+            segment.active = False
+
+
+def download_ranges(url, output_filepath, size, connections, headers=None, progress=None, hasher=None, session=None):
+    """
+    Baixa um arquivo progressivo de `size` bytes com várias conexões (requisições com Range).
+    O arquivo é pré-alocado e cada bloco é gravado direto na sua posição (os.pwrite);
+    conexões que terminam antes roubam metade do trecho mais atrasado.
+    `progress(bytes_gravados)` é chamado a cada bloco. Com `hasher` (StreamingHasher), o início contíguo
+    já gravado do arquivo entra no hash à medida que cresce. `session` como em download_fragments().
+    Retorna o total de bytes gravados.
+    """
+    part_path = f"{output_filepath}{PART_SUFFIX}"
+    work = _RangeWork(size, max(1, connections))
+    fd = os.open(part_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        preallocate(fd, size)
+        with _session_scope(session) as session, \
+                concurrent.futures.ThreadPoolExecutor(max_workers=max(1, connections)) as executor:
+            workers = [executor.submit(_range_worker, session, url, headers, fd, work, progress, hasher) for _ in range(max(1, connections))]
+            for worker in workers:
+                worker.result()
+        if work.written != size:
+            raise requests.exceptions.ContentDecodingError(f"Download incompleto: {work.written} de {size} bytes.")
+        if hasher is not None:
+            hasher.follow(fd, size)
+    except BaseException:
+        os.close(fd)
+        _remove_part(part_path)
+        raise
+    os.close(fd)
+    os.replace(part_path, output_filepath)
+    return work.written
+
+
+def _range_worker(session, url, headers, fd, work, progress, hasher=None):
+    while (segment := work.take()) is not None:
+        try:
+            for attempt in range(FRAGMENT_RETRIES + 1):
+                try:
+                    _fetch_segment(session, url, headers, fd, work, segment, progress, hasher)
+                    break
+                except requests.exceptions.RequestException:
+                    if attempt == FRAGMENT_RETRIES:
+                        raise
+        finally:
+            work.release(segment)
+
+
+def _fetch_segment(session, url, headers, fd, work, segment, progress, hasher=None):
+    """Baixa o trecho a partir da posição atual, parando quando ele acaba (mesmo que encolha no meio)."""
+    if segment.remaining() <= 0:
+        return
+    request_headers = dict(headers or {}, Range=f'bytes={segment.position}-{segment.end}')
+    with session.get(url, headers=request_headers, timeout=REQUEST_TIMEOUT, stream=True) as response:
+        if response.status_code != 206:
+            raise requests.exceptions.HTTPError(f"Resposta {response.status_code} a uma requisição com Range.", response=response)
+        for chunk in response.iter_content(CHUNK_BYTES):
+            nbytes = work.limit(segment, len(chunk))
+            if nbytes:
+                os.pwrite(fd, chunk[:nbytes], segment.position)
+                remaining = work.advance(segment, nbytes)
+                if progress is not None:
+                    progress(work.written)
+                if hasher is not None:
+                    hasher.follow(fd, work.frontier(), wait=False)
+            else:
+                remaining = 0
+            if remaining <= 0:
+                return
+
+
+def _remove_part(part_path):
+    """Apaga o temporário pré-alocado de um download nativo que falhou (não há como retomá-lo)."""
+    try:
+        os.remove(part_path)
+    except FileNotFoundError:
+        pass
+
+
+def preallocate(fd, size):
+    """Reserva `size` bytes contíguos para o arquivo (posix_fallocate quando disponível; senão só define o tamanho)."""
+    if size <= 0:
+        return
+    if hasattr(os, 'posix_fallocate'):
+        try:
+            os.posix_fallocate(fd, 0, size)
+            return
+        except OSError:
+            pass # Sistema de arquivos sem suporte: cai para ftruncate
+    os.ftruncate(fd, size)
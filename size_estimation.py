@@ -0,0 +1,131 @@
+import concurrent.futures
+import re
+from urllib.parse import urljoin
+
+import requests
+
+PROBE_TIMEOUT = 5 # Segundos por requisição de sondagem
+PROBE_DEADLINE = 15 # Segundos para todas as sondagens de um vídeo; os formatos ainda sem resposta ficam sem estimativa
+MAX_SEGMENT_PROBES = 24 # Segmentos/fragmentos sondados por formato; o resto é extrapolado pela média
+
+_BYTERANGE_RE = re.compile(r'#EXT-X-BYTERANGE:(\d+)')
+
+
+def fill_missing_sizes(info, probe=True, max_workers=8):
+    """
+    Preenche 'filesize_estimate' (bytes) nos formatos do info_dict sem 'filesize'/'filesize_approx'.
+
+    Ordem: tbr × duração (sem rede); depois, se `probe`, sondagens em paralelo: HEAD/Range na URL
+    da mídia para formatos diretos, soma dos segmentos do manifesto para HLS e dos fragmentos para DASH.
+    A sondagem é só uma estimativa: uma falha (de rede ou resposta malformada) deixa o formato sem
+    tamanho, e o que não terminar em PROBE_DEADLINE é abandonado, sem atrasar a extração.
+    """
+    duration = info.get('duration')
+    to_probe = []
+    for f in info.get('formats') or []:
+        if f.get('filesize') or f.get('filesize_approx'):
+            continue
+        if f.get('tbr') and duration:
+            f['filesize_estimate'] = int(f['tbr'] * 1000 / 8 * duration)
+        elif probe and f.get('url'):
+            to_probe.append(f)
+
+    if not to_probe:
+        return info
+    # Executores separados: os formatos esperam pelas sondagens de segmentos, que não podem disputar as mesmas threads
+    session = requests.Session()
+    format_executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+    segment_executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+    try:
+        futures = {format_executor.submit(estimate_by_probing, f, session, segment_executor): f for f in to_probe}
+        done, _ = concurrent.futures.wait(futures, timeout=PROBE_DEADLINE)
+        for future in done:
+            try:
+                size = future.result()
+            except Exception: # Erro de rede ou cabeçalho inválido (ex.: Content-Length não numérico)
+                size = None
+            if size:
+                futures[future]['filesize_estimate'] = size
+    finally:
+        # Sem esperar: as sondagens ainda em andamento terminam sozinhas (PROBE_TIMEOUT) e são descartadas
+        format_executor.shutdown(wait=False, cancel_futures=True)
+        segment_executor.shutdown(wait=False, cancel_futures=True)
+        session.close()
+    return info
+
+
+def estimate_by_probing(f, session, executor=None):
+    """
+    Estima o tamanho de um formato consultando o servidor, de acordo com o protocolo.
+    `executor` (opcional) paraleliza as sondagens de segmentos/fragmentos.
+    """
+    protocol = f.get('protocol') or ''
+    headers = f.get('http_headers') or {}
+    if f.get('fragments'):
+        return _sum_fragments(f, session, headers, executor)
+    if protocol.startswith('m3u8'):
+        return _sum_hls_segments(f['url'], session, headers, executor)
+    if protocol in ('http', 'https', ''):
+        return probe_content_length(f['url'], session, headers)
+    return None
+
+
+def probe_content_length(url, session, headers=None):
+    """Tamanho do recurso via HEAD; se o servidor não informar, via GET com Range de 1 byte (Content-Range)."""
+    response = session.head(url, headers=headers, timeout=PROBE_TIMEOUT, allow_redirects=True)
+    if response.ok and response.headers.get('Content-Length') and 'gzip' not in response.headers.get('Content-Encoding', ''):
+        return int(response.headers['Content-Length'])
+    range_headers = dict(headers or {}, Range='bytes=0-0')
+    with session.get(url, headers=range_headers, timeout=PROBE_TIMEOUT, stream=True) as response:
+        content_range = response.headers.get('Content-Range', '')
+        if response.status_code == 206 and '/' in content_range and not content_range.endswith('/*'):
+            return int(content_range.rsplit('/', 1)[1])
+    return None
+
+
+def _sum_fragments(f, session, headers, executor=None):
+    """Soma os tamanhos dos fragmentos DASH; os que não trazem 'filesize' são estimados por amostragem."""
+    known_total = 0
+    unknown_urls = []
+    for fragment in f['fragments']:
+        if fragment.get('filesize'):
+            known_total += fragment['filesize']
+        elif fragment.get('url') or f.get('fragment_base_url'):
+            unknown_urls.append(fragment.get('url') or urljoin(f['fragment_base_url'], fragment.get('path', '')))
+        else:
+            return None
+    if not unknown_urls:
+        return known_total
+    unknown_total = _extrapolate_from_sample(unknown_urls, session, headers, executor)
+    return known_total + unknown_total if unknown_total else None
+
+
+def _sum_hls_segments(playlist_url, session, headers, executor=None):
+    """
+    Soma os segmentos da playlist HLS: exato se houver #EXT-X-BYTERANGE; senão sonda uma amostra
+    dos segmentos em paralelo e extrapola a média para os demais.
+    """
+    response = session.get(playlist_url, headers=headers, timeout=PROBE_TIMEOUT)
+    response.raise_for_status()
+    lines = [line.strip() for line in response.text.splitlines() if line.strip()]
+
+    byteranges = [int(match.group(1)) for match in map(_BYTERANGE_RE.match, lines) if match]
+    if byteranges:
+        return sum(byteranges)
+
+    segment_urls = [urljoin(response.url, line) for line in lines if not line.startswith('#')]
+    return _extrapolate_from_sample(segment_urls, session, headers, executor)
+
+
+def _extrapolate_from_sample(urls, session, headers, executor=None):
+    """Sonda até MAX_SEGMENT_PROBES URLs espalhadas pela lista e extrapola a média para todas."""
+    if not urls:
+        return None
+    step = max(1, len(urls) // MAX_SEGMENT_PROBES)
+    sample = urls[::step][:MAX_SEGMENT_PROBES]
+    probe = lambda url: probe_content_length(url, session, headers)
+    sizes = list(executor.map(probe, sample)) if executor is not None else [probe(url) for url in sample]
+    sizes = [size for size in sizes if size]
+    if not sizes:
+        return None
+    return int(sum(sizes) / len(sizes) * len(urls))
@@ -0,0 +1,49 @@
+import os
+
+STAGING_SUFFIX = ".staging" # Inserido antes da extensão, para que yt-dlp/ffmpeg continuem reconhecendo o container
+
+
+def staging_path(final_path):
+    """Caminho temporário no mesmo diretório (mesmo sistema de arquivos) do arquivo final: `nome.staging.ext`."""
+    base, ext = os.path.splitext(final_path)
+    return f"{base}{STAGING_SUFFIX}{ext}"
+
+
+def is_staging_path(path):
+    return os.path.splitext(path)[0].endswith(STAGING_SUFFIX)
+
+
+def commit_staged(staged_path, final_path):
+    """
+    Publica o arquivo temporário no caminho final: grava em disco (fsync), renomeia atomicamente
+    e grava o diretório, para que o arquivo final nunca apareça pela metade, nem após uma queda.
+    """
+    fd = os.open(staged_path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    os.replace(staged_path, final_path)
+    fsync_directory(os.path.dirname(final_path) or ".")
+
+
+def fsync_directory(directory):
+    """Grava em disco a entrada do diretório (o rename); ignorado onde não há suporte (ex.: Windows)."""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def discard_staged(staged_path):
+    """Remove o temporário de um download que falhou (os .part do yt-dlp ficam, para retomar)."""
+    try:
+        os.remove(staged_path)
+    except FileNotFoundError:
+        pass
@@ -0,0 +1,131 @@
+import copy
+import threading
+from contextlib import contextmanager
+
+import yt_dlp
+
+# --- Perfis de opções do yt-dlp ---
+# Cada perfil gera instâncias YoutubeDL reaproveitáveis; opções específicas de cada
+# chamada (formato, caminho de saída) são aplicadas temporariamente via YdlPool.lease().
+YDL_PROFILES = {
+    "info": {
+        'quiet': True,
+        'skip_download': True,
+        'force_generic_extractor': True,
+        'noplaylist': True,
+        'default_search': 'ytsearch', # Ajuda a yt-dlp a inferir o tipo de link
+        'retries': 3,
+    },
+    "download": {
+        'noplaylist': True,
+        'quiet': True,
+        'retries': 5,
+        'merge_output_format': 'mp4' # Força a mesclagem para mp4 se for vídeo+áudio separado
+    },
+    "stream": { # Um único stream (só vídeo ou só áudio) que será mesclado pelo próprio aplicativo
+        'noplaylist': True,
+        'quiet': True,
+        'retries': 5,
+    },
+}
+
+
+class YdlPool:
+    """
+    Mantém uma instância yt_dlp.YoutubeDL por thread e por perfil de opções.
+
+    YoutubeDL não é thread-safe, então cada thread trabalhadora recebe as suas próprias
+    instâncias (criadas na primeira utilização e reutilizadas depois). Instâncias de
+    threads que já terminaram são fechadas na próxima criação, e close_all() fecha todas.
+    """
+
+    def __init__(self, profiles=None):
+        self._profiles = profiles or YDL_PROFILES
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._instances = [] # (thread, perfil, instância) para controle do ciclo de vida
+
+    def get(self, profile):
+        """Retorna a instância da thread atual para o perfil, criando-a se necessário."""
+        instances = getattr(self._local, 'instances', None)
+        if instances is None:
+            instances = self._local.instances = {}
+        ydl = instances.get(profile)
+        if ydl is None:
+            ydl = yt_dlp.YoutubeDL(copy.deepcopy(self._profiles[profile]))
+            instances[profile] = ydl
+            with self._lock:
+                self._reap_dead_threads()
+                self._instances.append((threading.current_thread(), profile, ydl))
+        return ydl
+
+    @contextmanager
+    def lease(self, profile, **overrides):
+        """
+        Empresta a instância da thread atual com opções extras aplicadas só durante o bloco.
+        As opções originais do perfil são restauradas na saída, mesmo em caso de erro.
+        """
+        ydl = self.get(profile)
+        missing = object()
+        saved = {key: ydl.params.get(key, missing) for key in overrides}
+        ydl.params.update(copy.deepcopy(overrides))
+        _refresh_derived_params(ydl, overrides)
+        try:
+            yield ydl
+        finally:
+            for key, value in saved.items():
+                if value is missing:
+                    ydl.params.pop(key, None)
+                else:
+                    ydl.params[key] = value
+            _refresh_derived_params(ydl, saved)
+
+    def discard(self):
+        """Fecha e descarta as instâncias da thread atual (ex.: após um erro que deixou estado ruim)."""
+        instances = getattr(self._local, 'instances', None) or {}
+        with self._lock:
+            ydls = set(map(id, instances.values()))
+            self._instances = [entry for entry in self._instances if id(entry[2]) not in ydls]
+        for ydl in instances.values():
+            _close_quietly(ydl)
+        self._local.instances = {}
+
+    def close_all(self):
+        """Fecha todas as instâncias criadas pelo pool (usado no encerramento)."""
+        with self._lock:
+            entries, self._instances = self._instances, []
+        for _, _, ydl in entries:
+            _close_quietly(ydl)
+
+    def _reap_dead_threads(self):
+        alive = []
+        for entry in self._instances:
+            if entry[0].is_alive():
+                alive.append(entry)
+            else:
+                _close_quietly(entry[2])
+        self._instances = alive
+
+
+def _refresh_derived_params(ydl, keys):
+    """
+    Recalcula o que o YoutubeDL deriva das opções no __init__ após alterá-las numa instância já criada.
+    Usa atributos internos do YoutubeDL: a versão do yt-dlp fica fixada no requirements.txt e, ao atualizá-la,
+    estes atributos precisam ser conferidos.
+    """
+    if 'outtmpl' in keys:
+        ydl._parse_outtmpl()
+    if 'progress_hooks' in keys:
+        ydl._progress_hooks = list(ydl.params.get('progress_hooks') or [])
+    if 'format' in keys:
+        req_format = ydl.params.get('format')
+        ydl.format_selector = (
+            req_format if req_format in (None, '-') or callable(req_format)
+            else ydl.build_format_selector(req_format))
+
+
+def _close_quietly(ydl):
+    try:
+        ydl.close()
+    except Exception:
+        pass